@@ -1,10 +1,19 @@
-from flask import Flask, render_template, request, redirect, url_for, send_file, session, flash, Response
-from recommender.recommender import Recommender
-import pandas as pd
-from datetime import datetime, timedelta
-from ics import Calendar, Event
-import io
+from flask import Flask, render_template, request, redirect, url_for, session, flash, Response, g, jsonify
+from flask import before_render_template, template_rendered
+from recommender.ics_writer import iter_ics
+from recommender.scheduler import schedule_topics
+from recommender.paging import BANDS, in_band, select_page
+from recommender.cache import LRUCache
+from recommender.metrics import REGISTRY, REQUEST_SECONDS, STAGE_SECONDS, stage_timer
+from datetime import datetime, timezone
+import atexit
+import hashlib
+import hmac
+import logging
+import random
+import time
 import sqlite3
+import threading
 from functools import wraps
 from werkzeug.security import generate_password_hash, check_password_hash
 
@@ -14,41 +23,64 @@ import os
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 app.secret_key = os.environ.get("SECRET_KEY", "fallback_secret")
 
+# ---------------- Logging ----------------
+logger = logging.getLogger(__name__)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "WARNING"))
+# fraction of requests whose debug output is logged when LOG_LEVEL=DEBUG
+DEBUG_SAMPLE_RATE = float(os.environ.get("DEBUG_SAMPLE_RATE", "0.01"))
+
+def _debug_sampled():
+    return logger.isEnabledFor(logging.DEBUG) and random.random() < DEBUG_SAMPLE_RATE
+
 # ---------------- Database Setup ----------------
-def init_db():
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "users.db"), timeout=10)
-    cursor = conn.cursor()
-    cursor.execute('''CREATE TABLE IF NOT EXISTS users (
+# users.db is opened (and the users table created) on the first login/registration
+DB_PATH = os.path.join(BASE_DIR, "users.db")
+_db_local = threading.local()
+
+SQL_GET_USER = "SELECT * FROM users WHERE username=?"
+SQL_CREATE_USER = "INSERT INTO users (username, password) VALUES (?, ?)"
+
+def get_db():
+    """
+    Long-lived connection for the current thread (reopened after a fork).
+    sqlite3 caches prepared statements per connection, so the SQL_* queries
+    are compiled once per thread.
+    """
+    conn = getattr(_db_local, "conn", None)
+    if conn is None or _db_local.pid != os.getpid():
+        conn = sqlite3.connect(DB_PATH, timeout=10, cached_statements=64)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA cache_size=-8000")
+        conn.execute("PRAGMA mmap_size=67108864")
+        conn.execute("PRAGMA busy_timeout=10000")
+        init_db(conn)
+        _db_local.conn = conn
+        _db_local.pid = os.getpid()
+    return conn
+
+def init_db(conn=None):
+    # runs once per new connection instead of at import time
+    conn = conn or get_db()
+    conn.execute('''CREATE TABLE IF NOT EXISTS users (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
                         username TEXT UNIQUE NOT NULL,
                         password TEXT NOT NULL
                     )''')
     conn.commit()
-    conn.close()
-
-init_db()
 
 # ---------------- User Helpers ----------------
 def get_user(username):
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "users.db"), timeout=10)
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM users WHERE username=?", (username,))
-    user = cursor.fetchone()
-    conn.close()
-    return user
+    return get_db().execute(SQL_GET_USER, (username,)).fetchone()
 
 def create_user(username, password):
-    conn = sqlite3.connect(os.path.join(BASE_DIR, "users.db"), timeout=10)  
-    cursor = conn.cursor()
+    conn = get_db()
     try:
-        cursor.execute("INSERT INTO users (username, password) VALUES (?, ?)",
-                       (username, generate_password_hash(password)))
-        conn.commit()
+        with conn:
+            conn.execute(SQL_CREATE_USER, (username, generate_password_hash(password)))
         return True
     except sqlite3.IntegrityError:
         return False
-    finally:
-        conn.close()
 
 # ---------------- Authentication Routes ----------------
 @app.route("/", methods=["GET", "POST"])
@@ -84,6 +116,39 @@ def logout():
     return redirect(url_for("login"))
 
 # ---------------- Protected Routes ----------------
+@app.before_request
+def _refresh_resources():
+    if rec.loaded:
+        rec.refresh_resources()
+        rec.sync()
+
+# ---------------- Instrumentation ----------------
+@app.before_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def _record_latency(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - start, request.endpoint or "unknown",
+                                request.method, str(response.status_code))
+    return response
+
+@before_render_template.connect_via(app)
+def _template_start(sender, template, context, **extra):
+    g.render_start = time.perf_counter()
+
+@template_rendered.connect_via(app)
+def _template_done(sender, template, context, **extra):
+    start = g.pop("render_start", None)
+    if start is not None:
+        STAGE_SECONDS.observe(time.perf_counter() - start, "template_render")
+
+@app.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
 def login_required(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
@@ -92,102 +157,104 @@ def login_required(func):
         return func(*args, **kwargs)
     return wrapper
 
-# ---------------- Recommender Setup ----------------
-rec = Recommender(
-    
+# machine clients (e.g. the nightly LMS export) send "Authorization: Bearer $INGEST_TOKEN";
+# without a token configured the ingestion endpoints are disabled
+INGEST_TOKEN = os.environ.get("INGEST_TOKEN")
 
-topic_graph_path=os.path.join(BASE_DIR, "data/topic_graph.csv"),
-     student_data_path=os.path.join(BASE_DIR, "data/student_data.csv"),
-    history_path=os.path.join(BASE_DIR, "data/history.csv"),
-    resources_path=os.path.join(BASE_DIR, "data/resources.csv")
-)
+def token_required(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not INGEST_TOKEN:
+            return jsonify({"error": "event ingestion is disabled"}), 403
+        supplied = request.headers.get("Authorization", "").encode()
+        if not hmac.compare_digest(supplied, f"Bearer {INGEST_TOKEN}".encode()):
+            return jsonify({"error": "authentication required"}), 401
+        return func(*args, **kwargs)
+    return wrapper
 
-# ---------------- Adaptive Helper Functions ----------------
-try:
-    _topic_graph_df = pd.read_csv(os.path.join(BASE_DIR, "data/topic_graph.csv"))
-except Exception:
-    _topic_graph_df = pd.DataFrame(columns=["topic", "relation", "related_topic"])
+# ---------------- Recommender Setup ----------------
+_data_lock = None
+
+def _create_recommender():
+    global _data_lock
+    # pandas and the datasets are only imported/parsed on first use
+    from recommender.recommender import Recommender
+    from recommender.ingest import data_lock
+
+    # held (shared) while the CSVs are loaded, so the ingest CLI won't rewrite them under us
+    _data_lock = data_lock(os.path.join(BASE_DIR, "data"))
+
+    # RECOMMENDER_STORAGE=sqlite keeps learning data in RECOMMENDER_DB (imported from the CSVs on first run)
+    # RECOMMENDER_SHARED_DIR lets worker processes share one memory-mapped copy of history
+    recommender = Recommender(
+        topic_graph_path=os.path.join(BASE_DIR, "data/topic_graph.csv"),
+        student_data_path=os.path.join(BASE_DIR, "data/student_data.csv"),
+        history_path=os.path.join(BASE_DIR, "data/history.csv"),
+        resources_path=os.path.join(BASE_DIR, "data/resources.csv"),
+        storage=os.environ.get("RECOMMENDER_STORAGE", "csv"),
+        db_path=os.environ.get("RECOMMENDER_DB", os.path.join(BASE_DIR, "data/learning.db")),
+        snapshot_path=os.environ.get("RECOMMENDER_SNAPSHOT", os.path.join(BASE_DIR, "data/.snapshot.pkl")),
+        shared_dir=os.environ.get("RECOMMENDER_SHARED_DIR")
+    )
+    # the serving app owns the history files: fold the journal back into them on shutdown
+    atexit.register(recommender.close)
+    return recommender
 
-def _find_related(topic: str, relation: str):
-    if _topic_graph_df.empty:
-        return None
-    rows = _topic_graph_df[
-        (_topic_graph_df["topic"] == topic) & (_topic_graph_df["relation"].str.lower() == relation.lower())
-    ]
-    if not rows.empty:
-        return rows.iloc[0]["related_topic"]
-    return None
+class _LazyRecommender:
+    """Builds the Recommender on first attribute access and forwards to it."""
 
-def _get_confidence(student_id: int, topic: str) -> int:
-    vals = rec.history.loc[
-        (rec.history["student_id"] == student_id) & (rec.history["topic"] == topic),
-        "confidence"
-    ].values
-    return int(vals[0]) if len(vals) > 0 else 0
-
-# ----------- URL cleaner for app-level resources -----------
-def clean_url(url):
-    """Return empty string if falsy. Ensure url starts with http:// or https://"""
-    if not url or (isinstance(url, float) and pd.isna(url)):
-        return ""
-    u = str(url).strip()
-    if u.startswith("http://") or u.startswith("https://"):
-        return u
-    return "https://" + u.lstrip('/')
-
-# ----------- Robust resource lookup (handles different column names) -----------
-def _get_resources(topic: str):
-    """
-    Returns dict with keys 'youtube' and 'docs' (absolute URLs or empty string).
-    Looks for several possible column names in rec.resources or CSV.
-    """
-    try:
-        df = rec.resources
-    except Exception:
-        try:
-            df =pd.read_csv(os.path.join(BASE_DIR, "data/resources.csv"))
-        except Exception:
-            df = pd.DataFrame()
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
 
-    if df is None or df.empty:
-        return {"youtube": "", "docs": ""}
+    @property
+    def loaded(self):
+        return self._instance is not None
 
-    row = df[df["topic"] == topic]
-    if row.empty:
-        return {"youtube": "", "docs": ""}
+    def _load(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    object.__setattr__(self, "_instance", self._factory())
+        return self._instance
 
-    r = row.iloc[0]
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
 
-    # possible column names
-    youtube_candidates = ["youtube", "youtube_link", "youtube_url", "yt", "video"]
-    docs_candidates = ["docs", "documentation_link", "documentation", "docs_link", "documentation_url", "doc"]
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
 
-    youtube_val = ""
-    docs_val = ""
+rec = _LazyRecommender(_create_recommender)
+if os.environ.get("PRELOAD_DATA") == "1":
+    rec._load()
 
-    for col in youtube_candidates:
-        if col in r.index and pd.notna(r[col]) and str(r[col]).strip() != "":
-            youtube_val = clean_url(r[col])
-            break
+# ---------------- Adaptive Helper Functions ----------------
+def _find_related(topic: str, relation: str):
+    return rec.graph.first_related(topic, relation)
 
-    for col in docs_candidates:
-        if col in r.index and pd.notna(r[col]) and str(r[col]).strip() != "":
-            docs_val = clean_url(r[col])
-            break
+def _get_confidence(student_id: int, topic: str) -> int:
+    return rec.get_confidence(student_id, topic)
 
-    return {"youtube": youtube_val, "docs": docs_val}
+def _get_resources(topic: str):
+    """Returns dict with keys 'youtube' and 'docs' (absolute URLs or empty string)."""
+    return rec.get_resources(topic)
 
 def adaptive_transform(student_id: int, recs: list[dict]) -> list[dict]:
-    output = []
+    return list(iter_adaptive_transform(student_id, recs))
+
+def iter_adaptive_transform(student_id: int, recs):
+    """adaptive_transform as a generator, so paged queries can stop early."""
     seen = set()
     for r in recs:
         base_topic = r.get("topic")
         conf = int(r.get("confidence", _get_confidence(student_id, base_topic)))
         new_topic = base_topic
-        strategy = "focus"
+        strategy = r.get("strategy", "focus")
 
         if conf < 50:
-            rel = _find_related(base_topic, "prerequisite")
+            # send the student to the deepest gap under the topic, not just one hop down
+            rel = rec.root_gap(student_id, base_topic) or _find_related(base_topic, "prerequisite")
             if rel:
                 new_topic = rel
                 strategy = "prerequisite"
@@ -204,15 +271,23 @@ def adaptive_transform(student_id: int, recs: list[dict]) -> list[dict]:
         new_conf = _get_confidence(student_id, new_topic)
         res = _get_resources(new_topic)
 
-        output.append({
+        yield {
             "topic": new_topic,
             "confidence": new_conf,
             "youtube": res.get("youtube", ""),
             "docs": res.get("docs", ""),
             "adapted_from": base_topic,
             "strategy": strategy
-        })
-    return output
+        }
+
+def _build_recommendations(student_id: int) -> list[dict]:
+    base_recs = rec.get_next_recommendations(student_id)
+    try:
+        with stage_timer("adaptive_transform"):
+            return adaptive_transform(student_id, base_recs)
+    except Exception:
+        logger.exception("Adaptive transform failed for student %s", student_id)
+        return base_recs
 
 def colorMap(conf):
     if conf < 50: return 'rgba(255,0,0,0.7)'
@@ -220,6 +295,52 @@ def colorMap(conf):
     else: return 'rgba(41,121,255,0.7)'
 app.jinja_env.filters['colorMap'] = colorMap
 
+# ---------------- Page Cache ----------------
+# rendered student pages keyed by (view, student, query args), each tagged with
+# the recommender version it was rendered from
+_page_cache = LRUCache(int(os.environ.get("PAGE_CACHE_SIZE", "2048")))
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    return request.if_modified_since is not None and request.if_modified_since >= last_modified
+
+def cached_page(view):
+    """
+    Serve a student view from the page cache while rec.version(student_id)
+    is unchanged, with a content ETag and Last-Modified so clients can
+    revalidate with a 304 instead of downloading the page again.
+    """
+    @wraps(view)
+    def wrapper(student_id, **kwargs):
+        key = (request.endpoint, student_id, tuple(sorted(request.args.items(multi=True))))
+        stamp = rec.version(student_id)
+        entry = _page_cache.get(key)
+        if entry is None or entry["stamp"] != stamp:
+            body = view(student_id, **kwargs)
+            etag = hashlib.sha1(body.encode("utf-8")).hexdigest()
+            # an identical re-render keeps its original modification time
+            if entry is not None and entry["etag"] == etag:
+                last_modified = entry["last_modified"]
+            else:
+                last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+            entry = {"stamp": stamp, "etag": etag, "last_modified": last_modified, "body": body}
+            # not cached if a write (e.g. seeding) touched the student while rendering
+            if rec.version(student_id) == stamp:
+                _page_cache.put(key, entry)
+
+        if _not_modified(entry["etag"], entry["last_modified"]):
+            response = Response(status=304)
+        else:
+            response = Response(entry["body"], mimetype="text/html")
+        response.set_etag(entry["etag"])
+        response.last_modified = entry["last_modified"]
+        # per-user pages: browsers may keep them but must revalidate; shared proxies must not store them
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+    return wrapper
+
 # ---------------- Main Routes ----------------
 @app.route('/landing')
 @login_required
@@ -229,6 +350,7 @@ def landing():
 
 @app.route('/dashboard/<int:student_id>')
 @login_required
+@cached_page
 def dashboard(student_id):
     confidences = rec.generate_confidence_scores(student_id).to_dict(orient='records')
     colors = [colorMap(c['confidence']) for c in confidences]
@@ -236,6 +358,7 @@ def dashboard(student_id):
 
 @app.route('/progress/<int:student_id>')
 @login_required
+@cached_page
 def progress(student_id):
     """
     Display student progress, strengths, weaknesses, badges,
@@ -251,48 +374,38 @@ def progress(student_id):
     # Convert to list of dicts for template rendering
     confidences = student_history.to_dict(orient='records')
 
-    # Debugging output
-    print(f"[DEBUG] Confidences for student {student_id}: {confidences}")
+    if _debug_sampled():
+        logger.debug("Confidences for student %s: %s", student_id, confidences)
 
     # Classify strengths and weaknesses
     strengths = [c for c in confidences if c['confidence'] >= 80]
     weaknesses = [c for c in confidences if c['confidence'] < 50]
 
-    # Award badges based on performance
+    # Award badges based on performance (counts come from the running aggregates)
+    summary = rec.student_summary(student_id)
     badges = []
-    if len(strengths) >= 3:
+    if summary['strong'] >= 3:
         badges.append("Consistency Star ⭐")
-    if len(weaknesses) <= 1 and len(strengths) > 0:
+    if summary['weak'] <= 1 and summary['strong'] > 0:
         badges.append("Improvement Badge 📈")
-    if max([c['confidence'] for c in confidences], default=0) >= 90:
+    if summary['max'] >= 90:
         badges.append("High Achiever 🏆")
 
-    # Get study plan and resource links
-    study_plan = rec.get_study_plan()
-    resources = rec.resources.to_dict(orient='records') if not rec.resources.empty else []
-
     return render_template(
         'progress.html',
         student_id=student_id,
         confidences=confidences,
         strengths=strengths,
         weaknesses=weaknesses,
-        badges=badges,
-        study_plan=study_plan,
-        resources=resources
+        badges=badges
     )
 # ---------------- Recommendations Route ----------------
 @app.route('/recommendations/<int:student_id>')
 @login_required
+@cached_page
 def recommendations(student_id):
-    # Get base recommendations
-    all_recs = rec.get_next_recommendations(student_id)
-
-    # Apply adaptive transformation
-    try:
-        all_recs = adaptive_transform(student_id, all_recs)
-    except Exception as e:
-        print("[ERROR] Adaptive transform failed:", e)
+    # Base recommendations + adaptive transformation (cached per student)
+    all_recs = rec.cached_recommendations(student_id, _build_recommendations)
 
     # ---------------- Ensure Keys Exist ----------------
     for r in all_recs:
@@ -300,33 +413,20 @@ def recommendations(student_id):
         r['docs'] = r.get('docs', '')
         r['strategy'] = r.get('strategy', 'focus')
 
-    # ---- DEBUG PRINT: show what URL strings are being passed ----
-    for r in all_recs:
-        print(f"[DEBUG LINKS] topic={r.get('topic')} youtube={r.get('youtube')} docs={r.get('docs')}")
+    if _debug_sampled():
+        logger.debug("Links for student %s: %s", student_id,
+                     [(r.get('topic'), r.get('youtube'), r.get('docs')) for r in all_recs])
 
-    # ---------------- Filter by Confidence ----------------
+    # ---------------- Filter + Pagination ----------------
     filter_level = request.args.get('filter', 'all')
-    if filter_level != 'all':
-        filtered = []
-        for r in all_recs:
-            conf = int(r.get('confidence', 0))
-            if filter_level == 'weak' and conf < 50:
-                filtered.append(r)
-            elif filter_level == 'moderate' and 50 <= conf < 80:
-                filtered.append(r)
-            elif filter_level == 'strong' and conf >= 80:
-                filtered.append(r)
-        all_recs = filtered
-
-    # ---------------- Pagination ----------------
+    if filter_level not in BANDS:
+        filter_level = 'all'
     page = max(int(request.args.get('page', 1)), 1)
-    per_page = int(request.args.get('per_page', 5))
-    total = len(all_recs)
+    per_page = max(int(request.args.get('per_page', 5)), 1)
+    paginated_recs, total, _ = select_page(all_recs, filter_level, (page - 1) * per_page, per_page)
     total_pages = (total + per_page - 1) // per_page
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated_recs = all_recs[start:end]
-    print("DEBUG RECS:", paginated_recs)
+    if _debug_sampled():
+        logger.debug("Recommendations page %s for student %s: %s", page, student_id, paginated_recs)
 
     # ---------------- Add Color for Display ----------------
     for r in paginated_recs:
@@ -340,7 +440,8 @@ def recommendations(student_id):
 
     # ---------------- Badges ----------------
     badges = []
-    confidences = [int(r.get('confidence', 0)) for r in all_recs]
+    # summarised over the whole band, not just this page
+    confidences = [c for c in (int(r.get('confidence', 0)) for r in all_recs) if in_band(c, filter_level)]
     if sum(c >= 80 for c in confidences) >= 3:
         badges.append("Consistency Star ⭐")
     if sum(c < 50 for c in confidences) == 0:
@@ -359,49 +460,138 @@ def recommendations(student_id):
         badges=badges
     )
 
+@app.route('/api/recommendations/<int:student_id>')
+@login_required
+def recommendations_api(student_id):
+    """
+    Infinite-scroll feed: ?filter=<band>&offset=0&limit=20[&total=1][&mode=peers].
+    Only the requested slice is computed; the total (a full pass) is opt-in.
+    """
+    filter_level = request.args.get('filter', 'all')
+    if filter_level not in BANDS:
+        return jsonify({"error": f"unknown filter {filter_level!r}"}), 400
+    from recommender.recommender import MODES
+    mode = request.args.get('mode', 'graph')
+    if mode not in MODES:
+        return jsonify({"error": f"unknown mode {mode!r}"}), 400
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    with_total = request.args.get('total') == '1'
+    try:
+        items, total, has_more = rec.query_recommendations(
+            student_id, filter_level, offset, limit, transform=iter_adaptive_transform, with_total=with_total,
+            mode=mode)
+    except Exception:
+        logger.exception("Adaptive transform failed for student %s", student_id)
+        items, total, has_more = rec.query_recommendations(student_id, filter_level, offset, limit,
+                                                           with_total=with_total, mode=mode)
+    return jsonify({
+        "items": items,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": offset + len(items) if has_more else None,
+        "total": total,
+    })
+
+@app.route('/api/similar/<int:student_id>')
+@login_required
+def similar_students_api(student_id):
+    """?k=20: the students whose confidences are closest to this student's (cosine)."""
+    k = min(max(request.args.get('k', 20, type=int), 1), 100)
+    return jsonify({"student_id": student_id, "similar": rec.similar_students(student_id, k)})
+
+@app.route('/api/learning-path/<int:student_id>')
+@login_required
+def learning_path_api(student_id):
+    """?topic=<name>: the student's unmastered prerequisites for a topic, roots first."""
+    topic = request.args.get('topic', '')
+    if topic not in rec.topic_ids:
+        return jsonify({"error": f"unknown topic {topic!r}"}), 404
+    steps = []
+    for step in rec.learning_path(student_id, topic):
+        res = _get_resources(step)
+        steps.append({"topic": step, "confidence": _get_confidence(student_id, step),
+                      "youtube": res.get("youtube", ""), "docs": res.get("docs", "")})
+    return jsonify({"topic": topic, "path": steps})
+
+
+# ---------------- Cohort ----------------
+@app.route('/api/leaderboard')
+@login_required
+def leaderboard_api():
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 100)
+    min_topics = max(request.args.get('min_topics', 1, type=int), 1)
+    return jsonify({"students": rec.leaderboard(limit, min_topics)})
+
+@app.route('/api/distribution')
+@login_required
+def distribution_api():
+    return jsonify(rec.confidence_distribution())
+
+# ---------------- Event Ingestion ----------------
+_ingest_worker = None
+_ingest_lock = threading.Lock()
+
+def _get_ingest_worker():
+    global _ingest_worker
+    with _ingest_lock:
+        if _ingest_worker is None:
+            from recommender.ingest import IngestWorker
+            # job status lives on disk so any worker process can answer a poll
+            _ingest_worker = IngestWorker(rec, jobs_dir=os.environ.get(
+                "INGEST_JOBS_DIR", os.path.join(BASE_DIR, "data/ingest_jobs")))
+        return _ingest_worker
+
+@app.route('/api/events', methods=['POST'])
+@token_required
+def ingest_events():
+    """
+    Accepts a batch of {"student_id", "topic", "gain"} events as JSON lines
+    (default) or CSV (?format=csv or a text/csv body) and queues it for the
+    background worker. Poll /api/events/<job> for the result.
+    """
+    from recommender.ingest import parse_events
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'jsonl')
+    try:
+        events = parse_events(request.get_data(), fmt, known_topics=rec.topic_ids)
+    except ValueError as exc:
+        return jsonify({"error": str(exc)}), 400
+    job_id = _get_ingest_worker().submit(events)
+    return jsonify({"job": job_id, "events": len(events),
+                    "status_url": url_for('ingest_status', job_id=job_id)}), 202
+
+@app.route('/api/events/<job_id>')
+@token_required
+def ingest_status(job_id):
+    job = _get_ingest_worker().status(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job)
 
 # ---------------- Planning Route (Safe) ----------------
 @app.route('/planning/<int:student_id>', methods=['GET', 'POST'])
 @login_required
 def planning(student_id):
-    base_recs = rec.get_next_recommendations(student_id)
-    try:
-        all_recs = adaptive_transform(student_id, base_recs)
-    except Exception:
-        all_recs = base_recs
+    all_recs = rec.cached_recommendations(student_id, _build_recommendations)
 
     plan = []
 
     if request.method == 'POST':
         start_date_str = request.form.get('start_date')
         hours_str = request.form.get('hours')
-        days_str = request.form.get('days')
         selected_topics = request.form.getlist('topics')
 
-        if start_date_str and hours_str and days_str and selected_topics:
+        if start_date_str and hours_str and selected_topics:
             start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
             hours_per_day = int(hours_str)
-            days_available = int(days_str)
-
-            current_date = start_date
-            topic_index = 0
-
-            while topic_index < len(selected_topics):
-                for _ in range(days_available):
-                    if topic_index >= len(selected_topics):
-                        break
-                    plan.append({
-                        'date': current_date.strftime("%Y-%m-%d"),
-                        'topic': selected_topics[topic_index],
-                        'hours': hours_per_day
-                    })
-                    topic_index += 1
-                    current_date += timedelta(days=1)
+
+            # prerequisites first; a topic takes its estimated_hours from resources, else one day
+            plan = schedule_topics(selected_topics, rec.graph, start_date, hours_per_day, rec.estimated_hours)
 
             # Store plan in recommender
-            rec.study_plan = pd.DataFrame(plan)
+            rec.set_study_plan(plan)
             # Save to CSV
-            rec.save()
+            rec.save_study_plan()
 
     return render_template(
         'planning.html',
@@ -412,31 +602,65 @@ def planning(student_id):
 
 
 # ---------------- ICS Download Route ----------------
+ICS_CACHE_MAX_BYTES = 1 << 20
+_ics_cache = {}
+
+def _study_plan_calendar():
+    """
+    Cache entry for the saved study plan, keyed on the store's plan stamp.
+    'payload' is (None, rows) until the first full download replaces it with
+    (body, None); one tuple, so a reader never sees half of the swap.
+    """
+    stamp = rec.store.study_plan_stamp()
+    if stamp is None:
+        return None
+    entry = _ics_cache.get("plan")
+    if entry is None or entry["stamp"] != stamp:
+        plan = rec.store.load_study_plan()
+        if plan is None:
+            return None
+        rows = list(plan[["date", "topic", "hours"]].itertuples(index=False, name=None))
+        entry = {
+            "stamp": stamp,
+            "etag": hashlib.sha1(repr(rows).encode("utf-8")).hexdigest(),
+            "last_modified": datetime.now(timezone.utc).replace(microsecond=0),
+            "payload": (None, rows),
+        }
+        _ics_cache["plan"] = entry
+    return entry
+
+def _stream_ics(entry, rows):
+    chunks, size = [], 0
+    for chunk in iter_ics(rows, entry["last_modified"]):
+        data = chunk.encode("utf-8")
+        if chunks is not None:
+            size += len(data)
+            if size <= ICS_CACHE_MAX_BYTES:
+                chunks.append(data)
+            else:
+                chunks = None
+        yield data
+    if chunks is not None:
+        entry["payload"] = (b"".join(chunks), None)
+
 @app.route('/download_plan/<int:student_id>')
 @login_required
 def download_plan(student_id):
-    try:
-        plan = pd.read_csv(os.path.join(BASE_DIR, "data/study_plan.csv")).to_dict(orient='records')
-    except FileNotFoundError:
+    entry = _study_plan_calendar()
+    if entry is None:
         return "No study plan generated yet. Please create one first."
 
-    cal = Calendar()
-    for p in plan:
-        e = Event()
-        e.name = p['topic']
-        event_date = datetime.strptime(p['date'], "%Y-%m-%d")
-        e.begin = event_date.replace(hour=9, minute=0)
-        e.duration = timedelta(hours=int(p.get('hours', 1)))
-        cal.events.add(e)
-
-    output = io.BytesIO(cal.serialize().encode('utf-8'))
-    output.seek(0)  # Ensure the pointer is at the start
-    return send_file(
-        output,
-        as_attachment=True,
-        download_name="study_plan.ics",
-        mimetype="text/calendar"
-    )
+    if _not_modified(entry["etag"], entry["last_modified"]):
+        response = Response(status=304)
+    else:
+        body, rows = entry["payload"]
+        payload = body if body is not None else _stream_ics(entry, rows)
+        response = Response(payload, mimetype="text/calendar")
+        response.headers["Content-Disposition"] = "attachment; filename=study_plan.ics"
+    response.set_etag(entry["etag"])
+    response.last_modified = entry["last_modified"]
+    response.cache_control.no_cache = True
+    return response
 
 
 import os
@@ -0,0 +1,156 @@
+"""
+Timed benchmarks for the recommender hot paths on a synthetic dataset.
+
+    python -m benchmarks.run --students 10000 --topics 5000 --history 10000000 --out results.json
+    python -m benchmarks.run --compare old.json new.json
+
+Each stage is timed per call over a sample of students, and the load over
+--builds separate instances (each closed again); the JSON output holds the
+dataset scale, environment and min/median/mean/max seconds per stage so
+runs can be compared. Every instance is built the same way, without
+seeding confidences, so the data on disk stays as generated.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import tempfile
+from datetime import datetime, timezone
+
+import pandas as pd
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from benchmarks.synthetic import generate  # noqa: E402
+from recommender.recommender import Recommender  # noqa: E402
+from recommender.scheduler import schedule_topics  # noqa: E402
+from recommender.ics_writer import iter_ics  # noqa: E402
+
+
+def timed(fn, args_list):
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - start)
+    return {
+        "calls": len(samples),
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "max": max(samples),
+    }
+
+
+def build(paths):
+    return Recommender(
+        topic_graph_path=paths["topic_graph"],
+        student_data_path=paths["student_data"],
+        history_path=paths["history"],
+        resources_path=paths["resources"],
+        seed_confidences=False,
+    )
+
+
+def build_and_close(paths):
+    build(paths).close()
+
+
+def study_plan(rec, adapt, student_id):
+    topics = [r["topic"] for r in adapt(student_id, rec.get_next_recommendations(student_id))]
+    plan = schedule_topics(topics, rec.graph, datetime(2025, 1, 1), 4)
+    return sum(len(chunk) for chunk in iter_ics((p["date"], p["topic"], p["hours"]) for p in plan))
+
+
+def run(paths, sample_size=50, seed=0, builds=3):
+    results = {}
+    # close() is timed too, but nothing was written so it has nothing to flush
+    results["Recommender.__init__"] = timed(build_and_close, [(paths,)] * builds)
+    rec = build(paths)
+
+    # adaptive_transform lives in the Flask module and reads its module-level recommender
+    import app as app_module
+    app_module.rec = rec
+    adapt = app_module.adaptive_transform
+
+    rng = random.Random(seed)
+    students = rec.list_students()
+    sample = [(sid,) for sid in rng.sample(students, min(sample_size, len(students)))]
+    base = {sid: rec.get_next_recommendations(sid) for (sid,) in sample}
+
+    results["generate_confidence_scores"] = timed(rec.generate_confidence_scores, sample)
+    results["get_next_recommendations"] = timed(rec.get_next_recommendations, sample)
+    results["adaptive_transform"] = timed(lambda sid: adapt(sid, [dict(r) for r in base[sid]]), sample)
+    results["get_badges"] = timed(rec.get_badges, sample)
+    results["study_plan"] = timed(lambda sid: study_plan(rec, adapt, sid), sample)
+    results["recommendations_frame"] = timed(lambda: rec.recommendations_frame([s for (s,) in sample]), [()])
+    rec.close()
+    return results
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)["results"]
+    with open(new_path) as f:
+        new = json.load(f)["results"]
+    print(f"{'stage':32} {'old median':>12} {'new median':>12} {'ratio':>8}")
+    for stage in new:
+        if stage in old:
+            a, b = old[stage]["median"], new[stage]["median"]
+            print(f"{stage:32} {a:12.6f} {b:12.6f} {b / a if a else float('inf'):8.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the recommender on synthetic data.")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--history", type=int, default=100000)
+    parser.add_argument("--sample", type=int, default=50, help="students timed per stage")
+    parser.add_argument("--builds", type=int, default=3, help="instances built to time the load")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="write the dataset here instead of a temp dir")
+    parser.add_argument("--out", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or tmp
+        start = time.perf_counter()
+        paths = generate(data_dir, args.students, args.topics, args.history, args.seed)
+        generated = time.perf_counter() - start
+        results = run(paths, args.sample, args.seed, args.builds)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "scale": {"students": args.students, "topics": args.topics, "history": args.history},
+        "sample": args.sample,
+        "builds": args.builds,
+        "seed": args.seed,
+        "environment": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "platform": platform.platform(),
+        },
+        "generate_seconds": generated,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Concurrency check for the single-writer/lock-free-reader design.
+
+    python -m benchmarks.stress
+    python -m benchmarks.stress --shared --readers 6 --writers 3
+    python -m benchmarks.stress --storage sqlite
+
+Reader threads hammer the cached and uncached read paths while writer
+threads update confidences, complete topics and sync. The journal flushes
+on a very short timer and compacts every few rows, so timer-thread
+compactions keep overlapping with writes (CSV storage). The run fails if a thread is
+still alive after --timeout (a deadlock), if any thread raised, if a
+cached result disagrees with a fresh computation, or if the history
+reloaded from disk differs from the in-memory copy.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import threading
+import traceback
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BASE_DIR not in sys.path:
+    sys.path.insert(0, BASE_DIR)
+
+from benchmarks.synthetic import generate  # noqa: E402
+from recommender.recommender import Recommender  # noqa: E402
+
+
+def build(paths, shared_dir=None, storage="csv"):
+    return Recommender(
+        topic_graph_path=paths["topic_graph"],
+        student_data_path=paths["student_data"],
+        history_path=paths["history"],
+        resources_path=paths["resources"],
+        storage=storage,
+        shared_dir=shared_dir,
+        seed_confidences=False,
+    )
+
+
+def reader(rec, students, n, iterations, errors):
+    rng = random.Random(n)
+    try:
+        for _ in range(iterations):
+            sid = rng.choice(students)
+            rec.cached_recommendations(sid, rec.get_next_recommendations)
+            rec.get_badges(sid)
+            rec.query_recommendations(sid, "weak", 0, 5)
+            len(rec.history)
+    except Exception:
+        errors.append(traceback.format_exc())
+
+
+def writer(rec, students, topics, n, iterations, errors):
+    rng = random.Random(100 + n)
+    try:
+        for i in range(iterations):
+            sid = rng.choice(students)
+            rec.update_confidence(sid, rng.choice(topics), rng.randint(1, 10))
+            if i % 50 == 0:
+                rec.set_completed_topics(sid, rec.get_completed_topics(sid) + [rng.choice(topics)])
+                rec.sync()
+    except Exception:
+        errors.append(traceback.format_exc())
+
+
+def frame_rows(history):
+    return set(history[["student_id", "topic", "confidence"]].itertuples(index=False, name=None))
+
+
+def run(paths, shared_dir=None, readers=6, writers=3, iterations=300, timeout=120.0, storage="csv"):
+    """Returns a list of failure messages (empty when the run passed)."""
+    rec = build(paths, shared_dir, storage)
+    journal = getattr(rec.store, "journal", None)
+    if journal is not None:
+        if shared_dir is None:
+            # batch by timer rather than by count, and compact often, so the timer thread compacts mid-write
+            journal.flush_every = 10 ** 9
+            journal.flush_interval = 0.001
+        journal.compact_every = 25
+
+    students = rec.list_students()
+    topics = list(rec.resource_map)[:50]
+    errors = []
+    threads = [threading.Thread(target=reader, args=(rec, students, i, iterations, errors), daemon=True)
+               for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(rec, students, topics, i, iterations, errors), daemon=True)
+                for i in range(writers)]
+    for t in threads:
+        t.start()
+    deadline = time.monotonic() + timeout
+    for t in threads:
+        t.join(max(0.0, deadline - time.monotonic()))
+    stuck = sum(t.is_alive() for t in threads)
+    if stuck:
+        return [f"{stuck} threads still running after {timeout:.0f}s (deadlock?)"]
+
+    failures = [f"thread failed:\n{e}" for e in errors]
+    stale = [s for s in students
+             if rec.cached_recommendations(s, rec.get_next_recommendations) != rec.get_next_recommendations(s)]
+    if stale:
+        failures.append(f"{len(stale)} students have stale cached recommendations")
+
+    expected = frame_rows(rec.history)
+    rec.close()
+    reloaded = build(paths, shared_dir, storage)
+    if frame_rows(reloaded.history) != expected:
+        failures.append("history reloaded from disk differs from memory")
+    reloaded.close()
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stress the recommender with concurrent readers and writers.")
+    parser.add_argument("--storage", choices=["csv", "sqlite"], default="csv")
+    parser.add_argument("--shared", action="store_true", help="use the memory-mapped shared store (csv)")
+    parser.add_argument("--readers", type=int, default=6)
+    parser.add_argument("--writers", type=int, default=3)
+    parser.add_argument("--iterations", type=int, default=300, help="operations per thread")
+    parser.add_argument("--students", type=int, default=300)
+    parser.add_argument("--topics", type=int, default=200)
+    parser.add_argument("--history", type=int, default=20000)
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds before a thread counts as stuck")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = generate(tmp, args.students, args.topics, args.history, seed=3)
+        shared_dir = os.path.join(tmp, "shared") if args.shared else None
+        failures = run(paths, shared_dir, args.readers, args.writers, args.iterations, args.timeout, args.storage)
+
+    for failure in failures:
+        print(failure)
+    print("FAILED" if failures else "ok")
+    if failures:
+        # stuck threads would otherwise keep the interpreter alive
+        os._exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Synthetic dataset generator for benchmarks.
+
+Writes topic_graph.csv, student_data.csv, history.csv, resources.csv and
+study_plan.csv in the same layout as data/, at any scale:
+
+    python -m benchmarks.synthetic --out /tmp/bench-data --students 10000 --topics 5000 --history 10000000
+"""
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+
+def topic_names(n_topics):
+    width = len(str(n_topics))
+    return np.array([f"Topic {i:0{width}d}" for i in range(n_topics)], dtype=object)
+
+
+def make_topic_graph(rng, names, max_prereqs=3, extra_edges=0.2):
+    n = len(names)
+    # every topic but the first few depends on 1..max_prereqs earlier topics
+    counts = rng.integers(1, max_prereqs + 1, size=n)
+    counts[:min(n, 3)] = 0
+    src = np.repeat(np.arange(n), counts)
+    dst = (rng.random(len(src)) * src).astype(np.int64)
+    graph = pd.DataFrame({
+        "topic": names[src],
+        "relation": "prerequisite",
+        "related_topic": names[dst],
+    })
+    n_extra = int(n * extra_edges)
+    if n_extra:
+        a = rng.integers(0, n, size=n_extra)
+        b = rng.integers(0, n, size=n_extra)
+        extra = pd.DataFrame({
+            "topic": names[a],
+            "relation": rng.choice(["related", "advanced"], size=n_extra),
+            "related_topic": names[b],
+        })
+        graph = pd.concat([graph, extra], ignore_index=True)
+    return graph.drop_duplicates(ignore_index=True)
+
+
+def make_student_data(rng, names, n_students, max_completed=20):
+    ids = np.arange(1, n_students + 1)
+    counts = rng.integers(0, max_completed + 1, size=n_students)
+    picks = rng.integers(0, len(names), size=int(counts.sum()))
+    owner = np.repeat(ids, counts)
+    completed = (
+        pd.DataFrame({"student_id": owner, "topic": names[picks]})
+        .drop_duplicates()
+        .groupby("student_id")["topic"].agg(";".join)
+    )
+    return pd.DataFrame({"student_id": ids}).merge(
+        completed.rename("completed_topics").reset_index(), on="student_id", how="left"
+    )
+
+
+def make_history(rng, names, n_students, n_rows):
+    # random (student, topic) pairs, duplicates dropped, so slightly fewer rows than asked
+    codes = rng.integers(0, n_students * len(names), size=n_rows, dtype=np.int64)
+    codes = np.unique(codes)
+    rng.shuffle(codes)
+    return pd.DataFrame({
+        "student_id": codes // len(names) + 1,
+        "topic": names[codes % len(names)],
+        "confidence": rng.integers(0, 101, size=len(codes)),
+    })
+
+
+def make_resources(names):
+    slugs = pd.Series(names).str.replace(" ", "_", regex=False)
+    return pd.DataFrame({
+        "topic": names,
+        "youtube_link": "youtu.be/" + slugs,
+        "documentation_link": "https://docs.example.com/" + slugs,
+    })
+
+
+def generate(out_dir, n_students=1000, n_topics=500, n_history=100000, seed=0):
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    names = topic_names(n_topics)
+    tables = {
+        "topic_graph": make_topic_graph(rng, names),
+        "student_data": make_student_data(rng, names, n_students),
+        "history": make_history(rng, names, n_students, n_history),
+        "resources": make_resources(names),
+        "study_plan": pd.DataFrame({"date": ["2025-01-01"], "topic": [names[0]], "hours": [2]}),
+    }
+    paths = {}
+    for name, df in tables.items():
+        paths[name] = os.path.join(out_dir, name + ".csv")
+        df.to_csv(paths[name], index=False)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic learning dataset.")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--topics", type=int, default=500)
+    parser.add_argument("--history", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    paths = generate(args.out, args.students, args.topics, args.history, args.seed)
+    for name, path in paths.items():
+        print(f"{name}: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+import heapq
+import numpy as np
+
+# confidence buckets 0-9, 10-19, ..., 90-100; the badge thresholds (50, 80, 90) fall on bucket edges
+BUCKETS = 10
+
+
+def bucket(confidence):
+    return min(int(confidence) // 10, BUCKETS - 1)
+
+
+class StudentAggregates:
+    """
+    Running per-student confidence aggregates, kept next to the history
+    index and updated on every confidence change, so progress and badge
+    reads never touch history.
+
+    Per student: (count, total, max, buckets) where buckets counts the
+    student's confidences per 10-point band. Entries are replaced, never
+    edited, so readers need no lock; updates must be serialised by the
+    caller (Recommender.writer). `cohort` is the same bucket histogram
+    summed over every student.
+    """
+
+    EMPTY = (0, 0, 0, (0,) * BUCKETS)
+
+    def __init__(self, index, topic_ids):
+        self.index = index
+        self.topic_ids = topic_ids
+        self._stats = {}
+        self.cohort = [0] * BUCKETS
+
+    def rebuild(self):
+        """Recompute every student from the index."""
+        stats = {}
+        cohort = [0] * BUCKETS
+        ids, _, conf = self.index.arrays(self.topic_ids)
+        if len(ids):
+            conf = np.clip(conf, 0, 100)
+            students, rows = np.unique(ids, return_inverse=True)
+            buckets = np.zeros((len(students), BUCKETS), dtype=np.int64)
+            np.add.at(buckets, (rows, np.minimum(conf // 10, BUCKETS - 1)), 1)
+            counts = np.bincount(rows, minlength=len(students)).tolist()
+            totals = np.bincount(rows, weights=conf, minlength=len(students)).astype(np.int64).tolist()
+            maxes = np.zeros(len(students), dtype=np.int64)
+            np.maximum.at(maxes, rows, conf)
+            for sid, count, total, top, row in zip(students.tolist(), counts, totals, maxes.tolist(),
+                                                   buckets.tolist()):
+                stats[sid] = (count, total, top, tuple(row))
+            cohort = buckets.sum(axis=0).tolist()
+        self._stats = stats
+        self.cohort = cohort
+
+    # ---------------- Updates ----------------
+    def update(self, student_id, old, new):
+        """One confidence changed from `old` (None for a new topic) to `new`; call after the index write."""
+        count, total, top, buckets = self._stats.get(student_id, self.EMPTY)
+        buckets = list(buckets)
+        if old is None:
+            count += 1
+        else:
+            total -= old
+            buckets[bucket(old)] -= 1
+            self.cohort[bucket(old)] -= 1
+        total += new
+        buckets[bucket(new)] += 1
+        self.cohort[bucket(new)] += 1
+        if new >= top:
+            top = new
+        elif old == top:
+            # the maximum went down; only then look at the student's other topics
+            top = max(self.index.topics(student_id).values())
+        self._stats[student_id] = (count, total, top, tuple(buckets))
+
+    def refresh(self, student_id):
+        """Recompute one student from the index (after changes whose old values are unknown)."""
+        old = self._stats.get(student_id, self.EMPTY)
+        for i, n in enumerate(old[3]):
+            self.cohort[i] -= n
+        values = list(self.index.topics(student_id).values())
+        buckets = [0] * BUCKETS
+        for conf in values:
+            buckets[bucket(conf)] += 1
+        for i, n in enumerate(buckets):
+            self.cohort[i] += n
+        self._stats[student_id] = (len(values), sum(values), max(values, default=0), tuple(buckets))
+
+    # ---------------- Reads ----------------
+    def summary(self, student_id):
+        count, total, top, buckets = self._stats.get(student_id, self.EMPTY)
+        return {
+            "student_id": student_id,
+            "topics": count,
+            "progress": round(total / count, 2) if count else 0,
+            "strong": buckets[8] + buckets[9],       # >= 80
+            "weak": sum(buckets[:5]),                # < 50
+            "high": buckets[9],                      # >= 90
+            "max": top,
+        }
+
+    def leaderboard(self, n=10, min_topics=1):
+        """Top-n students by mean confidence (ties: more topics, then lower id)."""
+        ranked = heapq.nsmallest(
+            n,
+            ((-total / count, -count, sid) for sid, (count, total, _, _) in list(self._stats.items())
+             if count >= min_topics),
+        )
+        return [self.summary(sid) for _, _, sid in ranked]
+
+    def distribution(self):
+        """Cohort histograms: every confidence, and each student's mean, per 10-point band."""
+        progress = [0] * BUCKETS
+        for count, total, _, _ in list(self._stats.values()):
+            if count:
+                progress[bucket(total / count)] += 1
+        labels = [f"{10 * i}-{10 * i + 9}" for i in range(BUCKETS - 1)] + ["90-100"]
+        return {
+            "buckets": labels,
+            "confidence": list(self.cohort),
+            "progress": progress,
+            "students": len(self._stats),
+        }
@@ -0,0 +1,139 @@
+"""
+"Students like you": cosine similarity between students' confidence vectors.
+
+PeerIndex holds history as a sparse student x topic matrix (CSR arrays,
+rows L2-normalised), so one student's similarity to any set of others is
+a gather and a segmented sum over their nonzeros. Small cohorts are scored
+exhaustively. Larger ones also get a random-hyperplane LSH index, built in
+batch: each of n_tables tables hashes a student to the signs of n_bits
+random projections of their vector, and a query only scores the students
+that share a bucket (or sit one bit away) with it in some table.
+
+The index is a snapshot of a HistoryIndex (or SharedHistoryIndex); the
+Recommender rebuilds it in the background once enough confidence writes
+have piled up, rather than patching it on every one.
+"""
+import numpy as np
+
+
+class PeerIndex:
+    def __init__(self, index, topic_ids, n_tables=32, n_bits=None, exact_below=50_000,
+                 max_candidates=20_000, seed=0):
+        self.topic_ids = topic_ids
+        self.n_tables = n_tables
+        self.n_bits = n_bits
+        self.max_candidates = max_candidates
+        students, topics, conf = index.arrays(topic_ids)
+        # ids are read before the width is, so they always fit
+        self.width = len(topic_ids)
+        conf = np.clip(conf, 0, 100).astype(np.float32)
+
+        order = np.lexsort((topics, students))
+        students, topics, conf = students[order], topics[order], conf[order]
+        keep = conf > 0
+        students, topics, conf = students[keep], topics[keep], conf[keep]
+        self.students, counts = np.unique(students, return_counts=True)
+        self.indptr = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.indices = topics
+        norms = np.sqrt(np.add.reduceat(conf * conf, self.indptr[:-1])) if len(conf) else conf
+        self.values = conf / np.repeat(norms, counts)
+        self._rows = dict(zip(self.students.tolist(), range(len(self.students))))
+
+        self._planes = None
+        if len(self.students) >= exact_below:
+            if self.n_bits is None:
+                # about 64 students per bucket, whatever the cohort size
+                self.n_bits = int(np.clip(np.log2(len(self.students) / 64), 4, 20))
+            self._build_tables(np.random.default_rng(seed))
+
+    def __len__(self):
+        return len(self.students)
+
+    def _gather(self, rows):
+        """Positions of the nonzeros of `rows`, with each row's length and start in that list."""
+        starts, ends = self.indptr[rows], self.indptr[rows + 1]
+        lengths = ends - starts
+        offsets = np.cumsum(lengths) - lengths
+        return np.repeat(starts - offsets, lengths) + np.arange(lengths.sum()), lengths, offsets
+
+    # ---------------- LSH ----------------
+    def _project(self, rows):
+        """Random projections of a block of rows (densified, so it is one BLAS matmul)."""
+        pos, lengths, _ = self._gather(rows)
+        dense = np.zeros((len(rows), self.width), dtype=np.float32)
+        dense[np.repeat(np.arange(len(rows)), lengths), self.indices[pos]] = self.values[pos]
+        return dense @ self._planes
+
+    def _signatures(self, proj):
+        """(rows, n_tables) bucket keys from projections."""
+        bits = (proj > self._bias).reshape(len(proj), self.n_tables, self.n_bits)
+        return bits.astype(np.int32) @ (1 << np.arange(self.n_bits, dtype=np.int32))
+
+    def _build_tables(self, rng, sample=20_000):
+        self._planes = rng.standard_normal((self.width, self.n_tables * self.n_bits)).astype(np.float32)
+        # confidences are all positive, so raw projections share a sign; split each
+        # hyperplane at the cohort's median projection instead so buckets stay balanced
+        rows = np.sort(rng.choice(len(self.students), min(sample, len(self.students)), replace=False))
+        self._bias = np.median(self._project(rows), axis=0)
+
+        keys = np.empty((len(self.students), self.n_tables), dtype=np.int32)
+        block = max(1, 2 ** 22 // self.width)
+        for lo in range(0, len(self.students), block):
+            hi = min(lo + block, len(self.students))
+            keys[lo:hi] = self._signatures(self._project(np.arange(lo, hi)))
+        self._order = np.argsort(keys, axis=0, kind='stable').astype(np.int32).T.copy()
+        self._keys = np.take_along_axis(keys, self._order.T, axis=0).T.copy()
+
+    def _candidates(self, dense):
+        keys = self._signatures(dense[None, :] @ self._planes)[0]
+        # the query's own bucket plus every bucket one bit flip away, per table
+        probes = keys[:, None] ^ np.concatenate(([0], 1 << np.arange(self.n_bits))).astype(np.int32)
+        found = []
+        for t in range(self.n_tables):
+            lo = np.searchsorted(self._keys[t], probes[t], side='left')
+            hi = np.searchsorted(self._keys[t], probes[t], side='right')
+            found.extend(self._order[t][a:b] for a, b in zip(lo.tolist(), hi.tolist()) if b > a)
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        rows, hits = np.unique(np.concatenate(found), return_counts=True)
+        if len(rows) > self.max_candidates:
+            # crowded buckets: keep the rows that collided in the most tables
+            rows = rows[np.argpartition(-hits, self.max_candidates)[:self.max_candidates]]
+        return rows.astype(np.int64)
+
+    # ---------------- Queries ----------------
+    def _scores(self, rows, dense):
+        """Cosine of each row in `rows` against the normalised dense query."""
+        if not len(rows):
+            return np.empty(0, dtype=np.float32)
+        pos, _, offsets = self._gather(rows)
+        # rows are never empty, so every offset starts a real segment
+        return np.add.reduceat(self.values[pos] * dense[self.indices[pos]], offsets)
+
+    def neighbours(self, student_id, confidences, k=20):
+        """
+        The k students most similar to `confidences` (the student's current
+        dense confidence vector), as (student_ids, similarities), best first.
+        The student themselves is left out.
+        """
+        dense = np.asarray(confidences[:self.width], dtype=np.float32)
+        norm = np.linalg.norm(dense)
+        if not norm or not len(self.students):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        dense = dense / norm
+
+        if self._planes is None:
+            rows = np.arange(len(self.students))
+        else:
+            rows = self._candidates(dense)
+        own = self._rows.get(student_id)
+        if own is not None:
+            rows = rows[rows != own]
+        scores = self._scores(rows, dense)
+        keep = scores > 0
+        rows, scores = rows[keep], scores[keep]
+        if len(rows) > k:
+            top = np.argpartition(-scores, k)[:k]
+            rows, scores = rows[top], scores[top]
+        best = np.lexsort((self.students[rows], -scores))
+        return self.students[rows[best]], scores[best]
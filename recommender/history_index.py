@@ -0,0 +1,156 @@
+from array import array
+from bisect import bisect_left
+import numpy as np
+import pandas as pd
+from recommender.topic_ids import TopicIds
+
+
+class HistoryIndex:
+    """
+    Keyed view over the history table. Per student it holds one
+    (ids, conf, rank) tuple: a sorted int32 array of interned topic ids,
+    a parallel uint8 array of confidences and the rank each topic was
+    added in (history row order, for display). Plain array.array keeps
+    them compact and bisectable; numpy views are taken for vectorised work.
+
+    The tuples are copy-on-write: set() builds new arrays and swaps the
+    student's tuple in one assignment, so readers never lock and always
+    see one consistent version of a student. Writers must be serialised
+    by the caller (see Recommender.writer).
+
+    This is the Recommender's working copy of history; the DataFrame form
+    is rebuilt from it with to_frame() when a whole-table view is needed.
+    """
+
+    def __init__(self, history=None, topic_ids=None):
+        self.topic_ids = topic_ids if topic_ids is not None else TopicIds()
+        self._rows = {}
+        if history is not None:
+            self.rebuild(history)
+
+    def rebuild(self, history):
+        rows = {}
+        if history is not None and not history.empty:
+            # first row wins, same as the old boolean-mask lookups
+            history = history[~history.duplicated(['student_id', 'topic'])]
+            ids = history['student_id'].to_numpy()
+            topics = self.topic_ids.encode(history['topic'])
+            ranks = np.arange(len(ids), dtype=np.int32)
+            order = np.lexsort((topics, ids))
+            ids, topics, ranks = ids[order], topics[order], ranks[order]
+            confs = np.clip(history['confidence'].to_numpy(), 0, 100).astype(np.uint8)[order]
+            bounds = np.flatnonzero(np.diff(ids)) + 1
+            starts = np.concatenate(([0], bounds)).tolist()
+            ends = np.concatenate((bounds, [len(ids)])).tolist()
+            for sid, lo, hi in zip(ids[starts].tolist(), starts, ends):
+                rows[sid] = (
+                    array('i', topics[lo:hi].tobytes()),
+                    array('B', confs[lo:hi].tobytes()),
+                    array('i', ranks[lo:hi].tobytes()),
+                )
+        self._rows = rows
+
+    @staticmethod
+    def _position(ids, code):
+        i = bisect_left(ids, code)
+        return i if i < len(ids) and ids[i] == code else None
+
+    # ---------------- Lookups ----------------
+    def get(self, student_id, topic, default=0):
+        row = self._rows.get(student_id)
+        code = self.topic_ids.get(topic)
+        if row is None or code is None:
+            return default
+        i = self._position(row[0], code)
+        return default if i is None else row[1][i]
+
+    def contains(self, student_id, topic):
+        row = self._rows.get(student_id)
+        code = self.topic_ids.get(topic)
+        return row is not None and code is not None and self._position(row[0], code) is not None
+
+    def topics(self, student_id):
+        row = self._rows.get(student_id)
+        if row is None:
+            return {}
+        ids, conf, rank = row
+        order = np.argsort(np.frombuffer(rank, dtype=np.int32), kind='stable').tolist()
+        return {self.topic_ids.name(ids[i]): conf[i] for i in order}
+
+    def confidence_vector(self, student_id, topic_ids):
+        """Dense uint8 confidences over every interned topic (0 where unknown)."""
+        # read the row before sizing the vector: its ids are always < len(topic_ids)
+        row = self._rows.get(student_id)
+        vec = np.zeros(len(topic_ids), dtype=np.uint8)
+        if row is not None:
+            vec[np.frombuffer(row[0], dtype=np.int32)] = np.frombuffer(row[1], dtype=np.uint8)
+        return vec
+
+    # ---------------- Mutation ----------------
+    def set(self, student_id, topic, confidence):
+        code = self.topic_ids.intern(topic)
+        confidence = min(max(int(confidence), 0), 100)
+        row = self._rows.get(student_id)
+        if row is None:
+            self._rows[student_id] = (array('i', [code]), array('B', [confidence]), array('i', [0]))
+            return
+        ids, conf, rank = array('i', row[0]), array('B', row[1]), array('i', row[2])
+        i = bisect_left(ids, code)
+        if i < len(ids) and ids[i] == code:
+            conf[i] = confidence
+        else:
+            ids.insert(i, code)
+            conf.insert(i, confidence)
+            rank.insert(i, max(rank) + 1)
+        self._rows[student_id] = (ids, conf, rank)
+
+    def set_many(self, student_ids, topics, confidences):
+        """set() for a batch; each touched student's row is copied and swapped once."""
+        batch = {}
+        for sid, topic, conf in zip(student_ids, topics, confidences):
+            batch.setdefault(sid, []).append((self.topic_ids.intern(topic), min(max(int(conf), 0), 100)))
+        for sid, updates in batch.items():
+            row = self._rows.get(sid)
+            if row is None:
+                ids, conf, rank = array('i'), array('B'), array('i')
+            else:
+                ids, conf, rank = array('i', row[0]), array('B', row[1]), array('i', row[2])
+            next_rank = max(rank) + 1 if rank else 0
+            for code, value in updates:
+                i = bisect_left(ids, code)
+                if i < len(ids) and ids[i] == code:
+                    conf[i] = value
+                else:
+                    ids.insert(i, code)
+                    conf.insert(i, value)
+                    rank.insert(i, next_rank)
+                    next_rank += 1
+            self._rows[sid] = (ids, conf, rank)
+
+    def arrays(self, topic_ids):
+        """(student_ids, topic ids, confidences) as int64 arrays, one entry per (student, topic)."""
+        items = list(self._rows.items())
+        counts = [len(row[0]) for _, row in items]
+        students = np.repeat(np.array([sid for sid, _ in items], dtype=np.int64), counts)
+        topics = np.frombuffer(b''.join(row[0] for _, row in items), dtype=np.int32).astype(np.int64)
+        conf = np.frombuffer(b''.join(row[1] for _, row in items), dtype=np.uint8).astype(np.int64)
+        return students, topics, conf
+
+    def to_frame(self):
+        items = list(self._rows.items())
+        if not items:
+            return pd.DataFrame(columns=['student_id', 'topic', 'confidence'])
+        counts = [len(row[0]) for _, row in items]
+        students = np.repeat(np.arange(len(counts)), counts)
+        rank = np.frombuffer(b''.join(row[2] for _, row in items), dtype=np.int32)
+        # students in index order, each student's topics in the order they were added
+        order = np.lexsort((rank, students))
+        names = np.array(self.topic_ids.names(range(len(self.topic_ids))), dtype=object)
+        return pd.DataFrame({
+            'student_id': np.array([sid for sid, _ in items], dtype=np.int64)[students[order]],
+            'topic': names[np.frombuffer(b''.join(row[0] for _, row in items), dtype=np.int32)[order]],
+            'confidence': np.frombuffer(b''.join(row[1] for _, row in items), dtype=np.uint8)[order].astype(np.int64),
+        })
+
+    def __len__(self):
+        return sum(len(row[0]) for row in list(self._rows.values()))
@@ -0,0 +1,60 @@
+"""
+Minimal streaming iCalendar (RFC 5545) writer for study plans.
+
+Events are yielded one VEVENT at a time so large plans never have to be
+held as a calendar object plus a serialised copy. UIDs are derived from
+the event contents, so re-exporting an unchanged plan produces identical
+bytes (which keeps calendar subscriptions from duplicating events).
+"""
+import hashlib
+from datetime import datetime, timezone
+
+PRODID = "-//Personal Recommendations//Study Plan//EN"
+START_HOUR = 9
+
+
+def _escape(text):
+    return (str(text).replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line):
+    # content lines longer than 75 octets are folded with CRLF + space
+    data = line.encode("utf-8")
+    if len(data) <= 75:
+        return line + "\r\n"
+    parts = []
+    while len(data) > 75:
+        cut = 75 if not parts else 74
+        while cut and (data[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(data[:cut].decode("utf-8"))
+        data = data[cut:]
+    parts.append(data.decode("utf-8"))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def iter_ics(plan_rows, stamp=None):
+    """
+    Yield the calendar as text chunks. plan_rows is an iterable of
+    (date "YYYY-MM-DD", topic, hours) tuples.
+    """
+    stamp = (stamp or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+    yield "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:" + PRODID + "\r\nCALSCALE:GREGORIAN\r\n"
+    for n, (date, topic, hours) in enumerate(plan_rows):
+        day = datetime.strptime(str(date), "%Y-%m-%d").strftime("%Y%m%d")
+        try:
+            hours = int(hours)
+        except (TypeError, ValueError):
+            hours = 1
+        uid = hashlib.sha1(f"{n}|{day}|{topic}|{hours}".encode("utf-8")).hexdigest()
+        yield (
+            "BEGIN:VEVENT\r\n"
+            f"UID:{uid}@study-plan\r\n"
+            f"DTSTAMP:{stamp}\r\n"
+            f"DTSTART:{day}T{START_HOUR:02d}0000Z\r\n"
+            f"DURATION:PT{hours}H\r\n"
+            + _fold("SUMMARY:" + _escape(topic)) +
+            "END:VEVENT\r\n"
+        )
+    yield "END:VCALENDAR\r\n"
@@ -0,0 +1,235 @@
+"""
+Bulk ingestion of quiz/assessment confidence events.
+
+Each event is {"student_id", "topic", "gain"}, as JSON lines or CSV with
+those columns (extra columns are ignored). Events are applied through
+Recommender.apply_confidence_gains, which coalesces them per
+(student, topic) and writes each student once.
+
+    python -m recommender.ingest events.jsonl
+    python -m recommender.ingest lms_export.csv --format csv --data-dir data
+
+The Flask app feeds uploads through an IngestWorker instead, so requests
+return as soon as the batch is parsed.
+
+The CLI rewrites history.csv directly, which is only safe while no app
+process has the CSVs loaded: a CSV-mode app never re-reads them and would
+overwrite the ingested rows when it next compacts. App processes hold
+data_lock() shared for as long as they have the data loaded and the CLI
+needs it exclusively, so it refuses to run next to one (send the file to
+POST /api/events instead).
+"""
+import io
+import os
+import re
+import json
+import time
+import uuid
+import queue
+import argparse
+import threading
+from collections import OrderedDict
+import pandas as pd
+from recommender.precompute import BASE_DIR, build_recommender
+
+try:
+    import fcntl
+except ImportError:  # no flock (Windows): the CLI guard is skipped
+    fcntl = None
+EVENT_COLUMNS = ["student_id", "topic", "gain"]
+FORMATS = ("jsonl", "csv")
+
+
+def parse_events(data, fmt="jsonl", known_topics=None):
+    """
+    Parse a JSONL or CSV payload (str, bytes or file) into a validated events
+    frame. With `known_topics`, events naming any other topic are rejected.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown event format: {fmt}")
+    if isinstance(data, bytes):
+        data = data.decode("utf-8")
+    if isinstance(data, str):
+        if not data.strip():
+            return pd.DataFrame(columns=EVENT_COLUMNS)
+        data = io.StringIO(data)
+    if fmt == "csv":
+        events = pd.read_csv(data)
+    else:
+        events = pd.read_json(data, lines=True, dtype=False)
+
+    missing = [c for c in EVENT_COLUMNS if c not in events.columns]
+    if missing:
+        raise ValueError(f"Events are missing columns: {', '.join(missing)}")
+    events = events[EVENT_COLUMNS].copy()
+    events["student_id"] = pd.to_numeric(events["student_id"], errors="coerce")
+    events["gain"] = pd.to_numeric(events["gain"], errors="coerce")
+    bad = events["student_id"].isna() | events["gain"].isna() | events["topic"].isna()
+    if bad.any():
+        raise ValueError(f"{int(bad.sum())} events have a missing or non-numeric field "
+                         f"(first is event #{int(bad.to_numpy().argmax()) + 1})")
+    events["student_id"] = events["student_id"].astype("int64")
+    events["gain"] = events["gain"].round().astype("int64")
+    events["topic"] = events["topic"].astype(str)
+    if known_topics is not None:
+        unknown = [t for t in events["topic"].unique().tolist() if t not in known_topics]
+        if unknown:
+            raise ValueError(f"{len(unknown)} unknown topics (first is {unknown[0]!r})")
+    return events
+
+
+def data_lock(data_dir, exclusive=False):
+    """
+    flock data_dir/.data.lock: shared for app processes (waits out a running
+    CLI), exclusive and non-blocking for the CLI. Returns the descriptor,
+    which holds the lock until closed (-1 without flock), or None when the
+    exclusive lock is taken elsewhere.
+    """
+    if fcntl is None:
+        return -1
+    fd = os.open(os.path.join(data_dir, ".data.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB if exclusive else fcntl.LOCK_SH)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+class IngestWorker:
+    """
+    Background thread applying submitted event batches to a Recommender.
+    Batches that queue up while one is being applied are merged and applied
+    together, so a burst of uploads becomes one coalesced write.
+
+    Job ids are random, and with `jobs_dir` every job's status is also
+    written there as <id>.json, so any worker process can answer a poll for
+    a job another one accepted. Only the newest `keep_jobs` are kept.
+    """
+
+    def __init__(self, rec, max_events=1_000_000, keep_jobs=1000, jobs_dir=None):
+        self.rec = rec
+        self.max_events = max_events
+        self.keep_jobs = keep_jobs
+        self.jobs_dir = jobs_dir
+        if jobs_dir:
+            os.makedirs(jobs_dir, exist_ok=True)
+        self._queue = queue.Queue()
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, events):
+        """Queue an events frame; returns a job id for status()."""
+        with self._lock:
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {"id": job_id, "status": "queued", "events": len(events)}
+            self._save(self._jobs[job_id])
+            while len(self._jobs) > self.keep_jobs:
+                self._jobs.popitem(last=False)
+            self._prune()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ingest-worker", daemon=True)
+                self._thread.start()
+        self._queue.put((job_id, events))
+        return job_id
+
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if not self.jobs_dir or not re.fullmatch(r"[0-9a-f]{32}", job_id):
+            return None
+        try:
+            with open(os.path.join(self.jobs_dir, job_id + ".json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def join(self):
+        """Block until everything submitted so far has been applied."""
+        self._queue.join()
+
+    def _update(self, job_ids, **fields):
+        with self._lock:
+            for job_id in job_ids:
+                if job_id in self._jobs:
+                    self._jobs[job_id].update(fields)
+                    self._save(self._jobs[job_id])
+
+    # ---------------- Job files ----------------
+    def _save(self, job):
+        if not self.jobs_dir:
+            return
+        path = os.path.join(self.jobs_dir, job["id"] + ".json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(job, f)
+        os.replace(path + ".tmp", path)
+
+    def _prune(self):
+        if not self.jobs_dir:
+            return
+        names = [n for n in os.listdir(self.jobs_dir) if n.endswith(".json")]
+        if len(names) <= self.keep_jobs:
+            return
+        paths = sorted((os.path.join(self.jobs_dir, n) for n in names), key=os.path.getmtime)
+        for path in paths[:len(paths) - self.keep_jobs]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][1])
+            while size < self.max_events:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                size += len(item[1])
+
+            job_ids = [job_id for job_id, _ in batch]
+            self._update(job_ids, status="running")
+            start = time.perf_counter()
+            try:
+                written = self.rec.apply_confidence_gains(pd.concat([e for _, e in batch], ignore_index=True))
+            except Exception as exc:
+                self._update(job_ids, status="failed", error=str(exc))
+            else:
+                self._update(job_ids, status="done", written=written, batch_events=size,
+                             seconds=round(time.perf_counter() - start, 3))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply a file of confidence events to the history.")
+    parser.add_argument("path", help="events file (.jsonl or .csv)")
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file extension")
+    parser.add_argument("--data-dir", default=os.path.join(BASE_DIR, "data"))
+    args = parser.parse_args(argv)
+
+    fmt = args.format or ("csv" if args.path.endswith(".csv") else "jsonl")
+    lock = data_lock(args.data_dir, exclusive=True)
+    if lock is None:
+        parser.error(f"an app process has {args.data_dir} loaded; POST the events to /api/events instead")
+    start = time.perf_counter()
+    rec = build_recommender(args.data_dir)
+    try:
+        with open(args.path, newline="") as f:
+            events = parse_events(f, fmt, known_topics=rec.topic_ids)
+        written = rec.apply_confidence_gains(events)
+    except ValueError as exc:
+        parser.error(str(exc))
+    # folds the new rows into history.csv
+    rec.close()
+    print(f"Applied {len(events)} events ({written} confidences) in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import os
+import csv
+import atexit
+import threading
+import pandas as pd
+
+
+class HistoryJournal:
+    """
+    Write-behind persistence for the history table.
+
+    Confidence changes are buffered in memory and appended to a small
+    journal file next to the snapshot CSV, either every `flush_every`
+    changes or `flush_interval` seconds after the first pending change.
+    Once the journal holds `compact_every` rows it is folded back into the
+    snapshot CSV and truncated. Reads never touch the disk.
+
+    At interpreter exit pending changes are only flushed to the journal;
+    the snapshot is rewritten by compact()/close(), which its owner calls.
+    """
+
+    COLUMNS = ["student_id", "topic", "confidence"]
+
+    def __init__(self, snapshot_path, snapshot_source, journal_path=None,
+                 flush_every=100, flush_interval=5.0, compact_every=10000):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or os.path.splitext(snapshot_path)[0] + ".journal.csv"
+        self.snapshot_source = snapshot_source
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+
+        self._pending = []
+        self._journal_rows = self._count_journal_rows()
+        self._lock = threading.RLock()
+        self._timer = None
+        atexit.register(self.flush)
+
+    # ---------------- Load ----------------
+    def _count_journal_rows(self):
+        if not os.path.exists(self.journal_path):
+            return 0
+        with open(self.journal_path, newline="") as f:
+            return sum(1 for _ in f)
+
+    def replay(self, history):
+        """Apply journalled changes (last write wins) on top of the snapshot."""
+        if not self._journal_rows:
+            return history
+        changes = pd.read_csv(self.journal_path, names=self.COLUMNS, header=None)
+        changes["student_id"] = changes["student_id"].astype(int)
+        merged = pd.concat([history, changes], ignore_index=True)
+        merged = merged.drop_duplicates(subset=["student_id", "topic"], keep="last")
+        return merged.reset_index(drop=True)
+
+    # ---------------- Write path ----------------
+    def record(self, student_id, topic, confidence):
+        with self._lock:
+            self._pending.append((student_id, topic, confidence))
+            if len(self._pending) >= self.flush_every:
+                self.flush()
+            elif self._timer is None and self.flush_interval:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def record_many(self, rows):
+        """Buffer a batch of (student_id, topic, confidence) rows and append them in one write."""
+        with self._lock:
+            self._pending.extend(rows)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+            with open(self.journal_path, "a", newline="") as f:
+                csv.writer(f).writerows(self._pending)
+            self._journal_rows += len(self._pending)
+            self._pending = []
+            if self._journal_rows >= self.compact_every:
+                self.compact()
+
+    def compact(self):
+        """Rewrite the snapshot CSV from memory and truncate the journal."""
+        with self._lock:
+            self._pending = []
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            tmp_path = self.snapshot_path + ".tmp"
+            self.snapshot_source().to_csv(tmp_path, index=False)
+            os.replace(tmp_path, self.snapshot_path)
+            if os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+            self._journal_rows = 0
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            if self._journal_rows:
+                self.compact()
+            atexit.unregister(self.flush)
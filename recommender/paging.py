@@ -0,0 +1,48 @@
+"""
+Confidence-band filtering and offset/limit paging over recommendation streams.
+
+The streams from Recommender.iter_recommendations are produced lazily in
+confidence order, so a page only costs the items up to offset + limit
+unless the caller also asks for the total.
+"""
+
+# (low, high) confidence bounds, high exclusive; None means unbounded
+BANDS = {
+    "all": (None, None),
+    "weak": (None, 50),
+    "moderate": (50, 80),
+    "strong": (80, None),
+}
+
+
+def in_band(confidence, band):
+    low, high = BANDS.get(band or "all", BANDS["all"])
+    return (low is None or confidence >= low) and (high is None or confidence < high)
+
+
+def select_page(recs, band=None, offset=0, limit=None, with_total=True, ascending=False):
+    """
+    Take one page of the recs in `band`. Returns (page, total, has_more);
+    total is None when with_total is False, in which case iteration stops
+    as soon as the page (plus one lookahead item) is known. `ascending`
+    promises recs are ordered by confidence, so iteration also stops once
+    the band's upper bound is passed.
+    """
+    high = BANDS.get(band or "all", BANDS["all"])[1]
+    end = None if limit is None else offset + limit
+    page = []
+    total = 0
+    for r in recs:
+        conf = int(r.get("confidence", 0))
+        if ascending and high is not None and conf >= high:
+            break
+        if not in_band(conf, band):
+            continue
+        if end is not None and total >= end and not with_total:
+            # one item past the page: there is more to scroll
+            return page, None, True
+        if total >= offset and (end is None or total < end):
+            page.append(r)
+        total += 1
+    has_more = end is not None and total > end
+    return page, (total if with_total else None), has_more
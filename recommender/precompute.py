@@ -0,0 +1,52 @@
+"""
+Nightly job: materialise recommendations for every student (or a subset).
+
+    python -m recommender.precompute --out data/precomputed_recommendations.csv
+    python -m recommender.precompute --students 101 102 --out recs.jsonl
+"""
+import os
+import argparse
+from recommender.recommender import Recommender
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_recommender(data_dir, seed_confidences=False):
+    # batch tools read the data as it is; seeding would write confidences back to history
+    return Recommender(
+        topic_graph_path=os.path.join(data_dir, "topic_graph.csv"),
+        student_data_path=os.path.join(data_dir, "student_data.csv"),
+        history_path=os.path.join(data_dir, "history.csv"),
+        resources_path=os.path.join(data_dir, "resources.csv"),
+        seed_confidences=seed_confidences
+    )
+
+
+def precompute(rec, out_path, student_ids=None, chunk_size=1000):
+    frame = rec.recommendations_frame(student_ids, chunk_size=chunk_size)
+    frame.insert(1, 'rank', frame.groupby('student_id').cumcount() + 1)
+    tmp_path = out_path + ".tmp"
+    if out_path.endswith(".jsonl"):
+        frame.to_json(tmp_path, orient="records", lines=True, force_ascii=False)
+    else:
+        frame.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, out_path)
+    return frame
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute recommendations for all students.")
+    parser.add_argument("--data-dir", default=os.path.join(BASE_DIR, "data"))
+    parser.add_argument("--out", default=os.path.join(BASE_DIR, "data", "precomputed_recommendations.csv"),
+                        help="output file (.csv or .jsonl)")
+    parser.add_argument("--students", type=int, nargs="*", help="student ids (default: all)")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    rec = build_recommender(args.data_dir)
+    frame = precompute(rec, args.out, args.students or None, args.chunk_size)
+    print(f"Wrote {len(frame)} recommendations for {frame['student_id'].nunique()} students to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,94 +1,525 @@
+import os
+import heapq
+import threading
+import numpy as np
 import pandas as pd
 import random
+from recommender.history_index import HistoryIndex
+from recommender.aggregates import StudentAggregates
+from recommender.collaborative import PeerIndex
+from recommender.storage import CsvStore, SqliteStore
+from recommender.topic_graph import TopicGraph
+from recommender.topic_ids import TopicIds
+from recommender.cache import LRUCache
+from recommender.metrics import stage_timer
+from recommender.paging import select_page
+from recommender.resources import EMPTY as NO_RESOURCES, build_estimates, build_resource_map, clean_url
+
+# confidence at which a topic counts as mastered (the "strong" band)
+MASTERY = 80
+
+# "graph": topic-graph rules only; "peers": blended with what similar students are strong in
+MODES = ("graph", "peers")
+PEER_NEIGHBOURS = 20
+PEER_TOPICS = 5
+# confidence writes after which the peer snapshot is rebuilt (fewer for small cohorts)
+PEER_REFRESH_WRITES = 1000
+
 
 class Recommender:
-    def __init__(self, topic_graph_path, student_data_path, history_path, resources_path, study_plan_path=None):
-        self.topic_graph = pd.read_csv(topic_graph_path)
-        self.student_data = pd.read_csv(student_data_path)
-        self.history = pd.read_csv(history_path)
-        self.resources = pd.read_csv(resources_path)
-        self.study_plan = pd.read_csv(study_plan_path) if study_plan_path else pd.DataFrame()
+    def __init__(self, topic_graph_path, student_data_path, history_path, resources_path, study_plan_path=None,
+                 cache_size=1024, storage="csv", db_path=None, snapshot_path=None, shared_dir=None,
+                 seed_confidences=True, confidence_seed=0):
+        # Readers never lock. Every mutation runs under this one lock and
+        # publishes new objects (index rows, student_data, study_plan, ...)
+        # by reference swap instead of editing shared ones in place.
+        self.writer = threading.RLock()
+        self.history_path = history_path
+        self.student_data_path = student_data_path
+        self.study_plan_path = study_plan_path or os.path.join(os.path.dirname(student_data_path), "study_plan.csv")
+        paths = {
+            "topic_graph": topic_graph_path,
+            "student_data": student_data_path,
+            "history": history_path,
+            "resources": resources_path,
+            "study_plan": self.study_plan_path,
+        }
+        # The journal snapshots the copy-on-write index itself: its flush timer can
+        # compact while a writer holding self.writer waits on the journal, so
+        # the lock order is always writer -> journal -> shared file lock.
+        history_source = lambda: self.index.to_frame()  # noqa: E731
+        if storage == "sqlite":
+            db_path = db_path or os.path.join(os.path.dirname(student_data_path), "learning.db")
+            self.store = SqliteStore(db_path, import_paths=paths)
+        elif storage == "csv" and shared_dir:
+            from recommender.shared import SharedCsvStore
+            self.store = SharedCsvStore(paths, history_source, shared_dir,
+                                        read_study_plan=study_plan_path is not None, snapshot_path=snapshot_path)
+        elif storage == "csv":
+            self.store = CsvStore(paths, history_source, read_study_plan=study_plan_path is not None,
+                                  snapshot_path=snapshot_path)
+        else:
+            raise ValueError(f"Unknown storage backend: {storage}")
+
+        data = self.store.load()
+        self.topic_graph = data["topic_graph"]
+        self.graph = TopicGraph(self.topic_graph)
+        # every topic seen anywhere, as dense int ids (graph topics first)
+        self.topic_ids = TopicIds()
+        self.graph.compiled(self.topic_ids)
+        self.graph.closure(self.topic_ids)
+        self.student_data = data["student_data"]
+        self.resources = data["resources"]
+        self.resource_map = build_resource_map(self.resources)
+        self.estimated_hours = build_estimates(self.resources)
+        self._resources_mtime = self.store.resources_mtime()
+        self.study_plan = data["study_plan"]
 
         self.student_data['student_id'] = self.student_data['student_id'].astype(int)
-        self.history['student_id'] = self.history['student_id'].astype(int)
+        self.completed = self._compile_completed(self.student_data)
+        self.index = data.get("index")
+        if self.index is None:
+            history = data["history"]
+            history['student_id'] = history['student_id'].astype(int)
+            self.index = HistoryIndex(history, self.topic_ids)
+        # per-student progress/badge aggregates, maintained on every confidence write
+        self.aggregates = StudentAggregates(self.index, self.topic_ids)
+        self.aggregates.rebuild()
+        # student-similarity snapshot for the "peers" mode, built on first use and
+        # refreshed once _peer_writes confidence writes have landed since it was taken
+        self._peers = None
+        self._peers_lock = threading.Lock()
+        self._peer_writes = 0
+        self._peers_refreshing = False
+
+        # adapted recommendation lists per student, tagged with the versions they were built from
+        self.rec_cache = LRUCache(cache_size)
+        self.data_version = 0
+        self._student_versions = {}
+
+        if seed_confidences:
+            self.seed_missing_confidences(confidence_seed)
 
     # ---------------- Utility ----------------
     def list_students(self):
         return self.student_data['student_id'].tolist()
 
+    def _compile_completed(self, student_data):
+        """student_id -> int32 ids of the ';'-joined completed_topics (first row per student wins)."""
+        if 'completed_topics' not in student_data.columns:
+            return {}
+        intern = self.topic_ids.intern
+        completed = {}
+        for sid, value in zip(student_data['student_id'].tolist(), student_data['completed_topics'].tolist()):
+            if sid not in completed:
+                topics = value.split(";") if pd.notna(value) else []
+                completed[sid] = np.array([intern(t) for t in topics], dtype=np.int32)
+        return completed
+
     def get_completed_topics(self, student_id):
-        record = self.student_data[self.student_data['student_id'] == student_id]
-        if record.empty or 'completed_topics' not in record.columns:
-            return []
-        topics = record['completed_topics'].values[0]
-        return topics.split(";") if pd.notna(topics) else []
+        ids = self.completed.get(student_id)
+        return self.topic_ids.names(ids.tolist()) if ids is not None else []
+
+    def set_completed_topics(self, student_id, topics):
+        value = ";".join(topics)
+        with self.writer:
+            student_data = self.student_data.copy()
+            mask = student_data['student_id'] == student_id
+            if mask.any():
+                student_data.loc[mask, 'completed_topics'] = value
+            else:
+                student_data.loc[len(student_data)] = [student_id, value]
+            intern = self.topic_ids.intern
+            self.completed[student_id] = np.array([intern(t) for t in topics], dtype=np.int32)
+            self.student_data = student_data
+            self.invalidate(student_id)
+
+    def get_confidence(self, student_id, topic):
+        return self.index.get(student_id, topic)
+
+    # ---------------- History ----------------
+    @property
+    def history(self):
+        """
+        Whole history table, built from the index on each call. The index is
+        the only copy kept; nothing holds on to the frame.
+        """
+        return self.index.to_frame()
+
+    @history.setter
+    def history(self, df):
+        with self.writer:
+            self.index.rebuild(df)
+            self.aggregates.rebuild()
+            self._peer_writes += PEER_REFRESH_WRITES
+            self.invalidate()
+
+    def _set_confidence(self, student_id, topic, conf):
+        with self.writer:
+            old = self.index.get(student_id, topic, None)
+            self.index.set(student_id, topic, conf)
+            self.aggregates.update(student_id, old, self.index.get(student_id, topic))
+            self._peer_writes += 1
+            self.store.record_confidence(student_id, topic, conf)
+            self.invalidate(student_id)
+
+    def sync(self):
+        """Pick up history written by other worker processes sharing the store."""
+        # called on every request: skip the writer and file locks when nothing changed on disk
+        if not self.store.needs_sync():
+            return
+        with self.writer:
+            changed = self.store.sync()
+            if changed is None:
+                self.aggregates.rebuild()
+                self._peer_writes += PEER_REFRESH_WRITES
+                self.invalidate()
+            elif changed:
+                self._peer_writes += len(changed)
+                for student_id in changed:
+                    self.aggregates.refresh(student_id)
+                    self.invalidate(student_id)
+
+    def _student_history(self, student_id):
+        rows = [
+            {"student_id": student_id, "topic": topic, "confidence": conf}
+            for topic, conf in self.index.topics(student_id).items()
+        ]
+        return pd.DataFrame(rows, columns=["student_id", "topic", "confidence"])
+
+    def seed_missing_confidences(self, seed=None):
+        """
+        Give every completed topic that has no history row a confidence in
+        [50, 100], for all students at once: one anti-join of completed
+        topics against the index, one vectorised draw and one batched write.
+        Runs at load so request paths only ever seed topics completed since.
+        Returns the number of confidences seeded.
+        """
+        with self.writer:
+            completed = list(self.completed.items())
+            if not completed:
+                return 0
+            known_students, known_topics, _ = self.index.arrays(self.topic_ids)
+            n = len(self.topic_ids)
+            owners = np.repeat(np.array([sid for sid, _ in completed], dtype=np.int64),
+                               [len(ids) for _, ids in completed])
+            topics = np.concatenate([ids for _, ids in completed]).astype(np.int64)
+            keys = owners * n + topics
+            # first occurrence of each pair, in completed_topics order
+            _, first = np.unique(keys, return_index=True)
+            first.sort()
+            missing = first[~np.isin(keys[first], known_students * n + known_topics)]
+            if not len(missing):
+                return 0
+
+            confidences = np.random.default_rng(seed).integers(50, 100, size=len(missing), endpoint=True).tolist()
+            student_ids = owners[missing].tolist()
+            names = self.topic_ids.names(topics[missing].tolist())
+            self.index.set_many(student_ids, names, confidences)
+            for student_id, conf in zip(student_ids, confidences):
+                self.aggregates.update(student_id, None, conf)
+            self._peer_writes += len(missing)
+            self.store.record_confidences(zip(student_ids, names, confidences))
+            self.invalidate()
+            return len(missing)
 
     def generate_confidence_scores(self, student_id):
-        completed = self.get_completed_topics(student_id)
-        for topic in completed:
-            exists = ((self.history['student_id'] == student_id) & (self.history['topic'] == topic)).any()
-            if not exists:
-                conf = random.randint(50, 100)
-                self.history.loc[len(self.history)] = [student_id, topic, conf]
-        self.history.to_csv("data/history.csv", index=False)
-        return self.history[self.history['student_id'] == student_id]
-
-    # ---------------- URL Cleaner ----------------
-    def clean_url(self, url):
-        if not url:
-            return ""
-        url = url.strip()
-        if url.startswith("http://") or url.startswith("https://"):
-            return url
-        return "https://" + url
+        with stage_timer("confidence_generation"):
+            self._seed_student(student_id)
+            return self._student_history(student_id)
 
-    # ---------------- Recommendations ----------------
-    def get_next_recommendations(self, student_id):
-        student_history = self.generate_confidence_scores(student_id)
+    def _seed_student(self, student_id):
         completed = self.get_completed_topics(student_id)
-        rec_topics = set()
+        if not all(self.index.contains(student_id, topic) for topic in completed):
+            with self.writer:
+                # only topics completed after load get here (see seed_missing_confidences);
+                # re-checked under the lock so concurrent requests seed each topic once
+                for topic in completed:
+                    if not self.index.contains(student_id, topic):
+                        conf = random.randint(50, 100)
+                        self._set_confidence(student_id, topic, conf)
+
+    # ---------------- Topic Graph ----------------
+    def add_edge(self, topic, relation, related_topic):
+        """
+        Add a topic-graph edge. Readers keep the graph they hold: a new one is
+        built, compiled and swapped in, and every cached result is dropped.
+        """
+        with self.writer:
+            graph = self.graph.with_edge(topic, relation, related_topic)
+            graph.compiled(self.topic_ids)
+            graph.closure(self.topic_ids)
+            self.topic_graph = graph.to_frame()
+            self.graph = graph
+            self.invalidate()
 
-        for _, row in self.topic_graph.iterrows():
-            topic = row['topic']
-            relation = row.get('relation', '')
-            related = row.get('related_topic', '')
+    # ---------------- Resources ----------------
+    def clean_url(self, url):
+        return clean_url(url)
 
-            if topic in completed:
-                continue
+    def get_resources(self, topic):
+        return self.resource_map.get(topic, NO_RESOURCES)
 
-            conf_record = student_history.loc[student_history['topic'] == topic, 'confidence']
-            conf = int(conf_record.values[0]) if not conf_record.empty else 0
+    def reload_resources(self):
+        resources = self.store.load_resources()
+        resource_map = build_resource_map(resources)
+        estimated_hours = build_estimates(resources)
+        with self.writer:
+            self.resources = resources
+            self.resource_map = resource_map
+            self.estimated_hours = estimated_hours
+            self._resources_mtime = self.store.resources_mtime()
+            self.invalidate()
 
-            if relation == 'prerequisite' and conf < 50 and related not in completed:
-                rec_topics.add(related)
+    def refresh_resources(self):
+        """Reload the resource map if the resources file changed on disk."""
+        mtime = self.store.resources_mtime()
+        if mtime is not None and mtime != self._resources_mtime:
+            self.reload_resources()
+            return True
+        return False
 
-            if relation != 'prerequisite' or related in completed:
-                rec_topics.add(topic)
+    # ---------------- Recommendations ----------------
+    def get_next_recommendations(self, student_id, mode="graph"):
+        ranked = self._ranked_topics(student_id, mode)
+        with stage_timer("resource_resolution"):
+            return list(self._resolve(ranked))
 
-        recommendations = []
-        for topic in rec_topics:
-            res = self.resources[self.resources['topic'] == topic]
-            conf_record = student_history.loc[student_history['topic'] == topic, 'confidence']
-            conf_val = int(conf_record.values[0]) if not conf_record.empty else 0
+    def iter_recommendations(self, student_id, mode="graph"):
+        """
+        Same recommendations as get_next_recommendations, in the same order,
+        but resolved one at a time off a heap so callers that only need the
+        first few don't pay for sorting and resolving the rest.
+        """
+        return self._resolve(self._ranked_topics(student_id, mode))
 
-            youtube_link = ""
-            docs_link = ""
-            if not res.empty:
-                if pd.notna(res['youtube_link'].values[0]):
-                    youtube_link = self.clean_url(res['youtube_link'].values[0])
-                if pd.notna(res['documentation_link'].values[0]):
-                    docs_link = self.clean_url(res['documentation_link'].values[0])
+    def query_recommendations(self, student_id, band=None, offset=0, limit=None, transform=None, with_total=True,
+                              mode="graph"):
+        """
+        One page of recommendations in a confidence band, see paging.select_page.
+        `transform(student_id, recs)` may rewrite the stream lazily (e.g. the
+        adaptive transform); it has to yield rather than build a list.
+        """
+        recs = self.iter_recommendations(student_id, mode)
+        if transform is not None:
+            recs = transform(student_id, recs)
+        return select_page(recs, band, offset, limit, with_total, ascending=transform is None)
 
-            recommendations.append({
+    def _ranked_topics(self, student_id, mode="graph"):
+        if mode not in MODES:
+            raise ValueError(f"Unknown recommendation mode: {mode}")
+        self.generate_confidence_scores(student_id)
+        with stage_timer("graph_traversal"):
+            rec_ids = self._walk_graph(student_id)
+            strategies = ["focus"] * len(rec_ids)
+        if mode == "peers":
+            with stage_timer("peer_topics"):
+                peer_ids = self._peer_topic_ids(student_id, rec_ids)
+                rec_ids = np.concatenate((rec_ids, peer_ids))
+                strategies += ["peers"] * len(peer_ids)
+        conf = self.index.confidence_vector(student_id, self.topic_ids)[rec_ids].tolist()
+        # the position breaks ties, so equal confidences keep topic id order
+        ranked = list(zip(conf, range(len(conf)), self.topic_ids.names(rec_ids.tolist()), strategies))
+        heapq.heapify(ranked)
+        return ranked
+
+    def _resolve(self, ranked):
+        while ranked:
+            conf_val, _, topic, strategy = heapq.heappop(ranked)
+            links = self.get_resources(topic)
+            yield {
                 "topic": topic,
                 "confidence": conf_val,
-                "youtube": youtube_link,   # matches template rec.youtube
-                "docs": docs_link,         # matches template rec.docs
-                "strategy": "focus"
-            })
+                "youtube": links["youtube"],   # matches template rec.youtube
+                "docs": links["docs"],         # matches template rec.docs
+                "strategy": strategy
+            }
 
-        recommendations.sort(key=lambda x: x['confidence'])
-        return recommendations
+    def _walk_graph(self, student_id):
+        """Ids of the recommended topics, evaluated over the compiled graph arrays."""
+        topics, has_other, src, dst = self.graph.compiled(self.topic_ids)
+        # ids are read before the masks are sized, so they always fit
+        completed = self.completed.get(student_id, [])
+        done = np.zeros(len(self.topic_ids), dtype=bool)
+        done[completed] = True
+        conf = self.index.confidence_vector(student_id, self.topic_ids)
+
+        # a weak, open topic pulls in its unfinished prerequisites
+        open_edges = ~done[src]
+        via_prereq = dst[open_edges & (conf[src] < 50) & ~done[dst]]
+        # an open topic is itself recommended once a prerequisite is done,
+        # or when it has any non-prerequisite relation
+        unlocked = src[open_edges & done[dst]]
+        direct = topics[has_other & ~done[topics]]
+        return np.unique(np.concatenate((via_prereq, unlocked, direct)))
+
+    # ---------------- Students Like You ----------------
+    def peer_index(self):
+        """
+        The PeerIndex snapshot of history, built on first use. Once it is
+        stale (see _peers_stale) a fresh one is built in a background thread
+        and swapped in; queries keep using the current one meanwhile.
+        """
+        peers = self._peers
+        if peers is None:
+            with self._peers_lock:
+                if self._peers is None:
+                    self.rebuild_peer_index()
+                peers = self._peers
+        elif self._peers_stale(peers) and not self._peers_refreshing:
+            with self.writer:
+                if self._peers_refreshing:
+                    return peers
+                self._peers_refreshing = True
+            threading.Thread(target=self._refresh_peers, name="peer-index", daemon=True).start()
+        return peers
+
+    def _peers_stale(self, peers):
+        return self._peer_writes >= min(PEER_REFRESH_WRITES, max(len(peers), 1))
+
+    def _refresh_peers(self):
+        try:
+            self.rebuild_peer_index()
+        finally:
+            self._peers_refreshing = False
+
+    def rebuild_peer_index(self):
+        """Rebuild the similarity snapshot from the current index and swap it in."""
+        with self.writer:
+            seen = self._peer_writes
+        # the index is copy-on-write, so the build itself needs no lock
+        peers = PeerIndex(self.index, self.topic_ids)
+        with self.writer:
+            self._peers = peers
+            # writes that landed during the build count towards the next refresh
+            self._peer_writes -= seen
+        return peers
+
+    def similar_students(self, student_id, k=PEER_NEIGHBOURS):
+        """The k students whose confidences look most like this student's, with cosine similarities."""
+        vector = self.index.confidence_vector(student_id, self.topic_ids)
+        students, sims = self.peer_index().neighbours(student_id, vector, k)
+        return [{"student_id": sid, "similarity": round(sim, 4)}
+                for sid, sim in zip(students.tolist(), sims.tolist())]
+
+    def _peer_topic_ids(self, student_id, exclude):
+        """
+        Ids of the topics the student's nearest peers are strong in, weighted
+        by similarity, that the student has neither completed nor mastered
+        and that aren't already in `exclude`; best first.
+        """
+        n = len(self.topic_ids)
+        vector = self.index.confidence_vector(student_id, self.topic_ids)
+        students, sims = self.peer_index().neighbours(student_id, vector, PEER_NEIGHBOURS)
+        if not len(students):
+            return np.empty(0, dtype=exclude.dtype)
+        score = np.zeros(n, dtype=np.float32)
+        for sid, sim in zip(students.tolist(), sims.tolist()):
+            score += sim * (self.index.confidence_vector(sid, self.topic_ids)[:n] >= MASTERY)
+        score[~self._open_topics(student_id)[:n]] = 0
+        score[exclude] = 0
+        top = np.flatnonzero(score)
+        return top[np.lexsort((top, -score[top]))][:PEER_TOPICS].astype(exclude.dtype)
+
+    # ---------------- Result Cache ----------------
+    def invalidate(self, student_id=None):
+        """Drop cached results for one student, or for everyone when the shared data changes."""
+        with self.writer:
+            if student_id is None:
+                self.data_version += 1
+                self.rec_cache.clear()
+            else:
+                self._student_versions[student_id] = self._student_versions.get(student_id, 0) + 1
+                self.rec_cache.invalidate(student_id)
+
+    def _cache_stamp(self, student_id):
+        return (self.data_version, self._student_versions.get(student_id, 0))
+
+    def version(self, student_id):
+        """Changes whenever anything a student's views are built from does (see invalidate)."""
+        return self._cache_stamp(student_id)
+
+    def cached_recommendations(self, student_id, build):
+        """
+        Return the cached result of build(student_id), computing it on a miss.
+        Callers get shallow copies so per-request tweaks don't leak into the cache.
+        A result is only cached if no write touched the student while it was built.
+        """
+        stamp = self._cache_stamp(student_id)
+        entry = self.rec_cache.get(student_id)
+        if entry is None or entry[0] != stamp:
+            entry = (stamp, build(student_id))
+            if self._cache_stamp(student_id) == stamp:
+                self.rec_cache.put(student_id, entry)
+        return [dict(r) for r in entry[1]]
+
+    # ---------------- Batch Recommendations ----------------
+    def recommendations_frame(self, student_ids=None, chunk_size=1000):
+        """
+        Same rules as get_next_recommendations, evaluated for many students at
+        once with joins over student_data, history and the topic graph.
+        Returns one row per (student_id, topic), sorted by confidence.
+        Completed topics are never recommended, so no confidences are seeded.
+        """
+        if student_ids is None:
+            student_ids = self.list_students()
+        student_ids = pd.Series(pd.unique(pd.Series(list(student_ids), dtype='int64')), name='student_id')
+        columns = ['student_id', 'topic', 'confidence', 'youtube', 'docs', 'strategy']
+
+        edges = self.graph.to_frame()
+        if edges.empty or student_ids.empty:
+            return pd.DataFrame(columns=columns)
+        edges['is_prereq'] = edges['relation'] == 'prerequisite'
+
+        completed = self.student_data[['student_id', 'completed_topics']].dropna()
+        completed = completed.assign(topic=completed['completed_topics'].str.split(';'))
+        completed = completed.explode('topic')[['student_id', 'topic']].drop_duplicates()
+        completed['done'] = True
+
+        conf = self.history.drop_duplicates(['student_id', 'topic'])[['student_id', 'topic', 'confidence']]
+        links = self._resource_frame()
+
+        chunks = []
+        for start in range(0, len(student_ids), chunk_size):
+            ids = student_ids.iloc[start:start + chunk_size].to_frame()
+            pairs = ids.merge(edges, how='cross')
+            pairs = pairs.merge(completed, on=['student_id', 'topic'], how='left')
+            pairs = pairs[pairs['done'].isna()].drop(columns='done')
+            pairs = pairs.merge(
+                completed.rename(columns={'topic': 'related_topic', 'done': 'related_done'}),
+                on=['student_id', 'related_topic'], how='left'
+            )
+            pairs['related_done'] = pairs['related_done'].notna()
+            pairs = pairs.merge(conf, on=['student_id', 'topic'], how='left')
+            pairs['confidence'] = pairs['confidence'].fillna(0)
+
+            via_prereq = pairs.loc[
+                pairs['is_prereq'] & (pairs['confidence'] < 50) & ~pairs['related_done'],
+                ['student_id', 'related_topic']
+            ].rename(columns={'related_topic': 'topic'})
+            direct = pairs.loc[~pairs['is_prereq'] | pairs['related_done'], ['student_id', 'topic']]
+            chunks.append(pd.concat([via_prereq, direct]).drop_duplicates())
+
+        result = pd.concat(chunks, ignore_index=True)
+        result = result.merge(conf, on=['student_id', 'topic'], how='left')
+        result['confidence'] = result['confidence'].fillna(0).astype(int)
+        result = result.merge(links, on='topic', how='left')
+        result[['youtube', 'docs']] = result[['youtube', 'docs']].fillna('')
+        result['strategy'] = 'focus'
+        result = result.sort_values(['student_id', 'confidence', 'topic'], kind='stable')
+        return result[columns].reset_index(drop=True)
+
+    def get_batch_recommendations(self, student_ids=None, chunk_size=1000):
+        student_ids = self.list_students() if student_ids is None else list(student_ids)
+        frame = self.recommendations_frame(student_ids, chunk_size)
+        batch = {sid: [] for sid in student_ids}
+        for sid, group in frame.groupby('student_id', sort=False):
+            batch[sid] = group.drop(columns='student_id').to_dict(orient='records')
+        return batch
+
+    def _resource_frame(self):
+        rows = [(topic, r['youtube'], r['docs']) for topic, r in self.resource_map.items()]
+        return pd.DataFrame(rows, columns=['topic', 'youtube', 'docs'])
 
     # ---------------- Adaptive Transform ----------------
     def adaptive_transform(self, student_id, recommendations):
@@ -97,54 +528,137 @@ class Recommender:
             r['strategy'] = 'focus' if r['confidence'] < 80 else 'review'
         return recommendations
 
+    # ---------------- Learning Paths ----------------
+    def _open_topics(self, student_id):
+        """Mask over topic ids of what the student has neither completed nor mastered."""
+        completed = self.completed.get(student_id, [])
+        open_ = self.index.confidence_vector(student_id, self.topic_ids) < MASTERY
+        open_[completed] = False
+        return open_
+
+    def learning_path(self, student_id, topic):
+        """
+        Every unmastered prerequisite of `topic`, however many hops down,
+        in learning order: each topic comes after everything it depends on.
+        """
+        code = self.topic_ids.get(topic)
+        if code is None:
+            return []
+        # the chain is read before the mask is sized, so its ids always fit
+        chain = self.graph.closure(self.topic_ids).chain(code)
+        if not len(chain):
+            return []
+        self._seed_student(student_id)
+        return self.topic_ids.names(chain[self._open_topics(student_id)[chain]].tolist())
+
+    def root_gap(self, student_id, topic):
+        """The first step of learning_path, or None when nothing below `topic` is missing."""
+        path = self.learning_path(student_id, topic)
+        return path[0] if path else None
+
     # ---------------- Progress ----------------
     def get_progress(self, student_id):
-        student_history = self.generate_confidence_scores(student_id)
-        if student_history.empty:
-            return 0
-        return round(student_history['confidence'].mean(), 2)
+        self._seed_student(student_id)
+        return self.aggregates.summary(student_id)["progress"]
+
+    def student_summary(self, student_id):
+        """Progress and badge counts (strong >= 80, weak < 50, high >= 90) from the running aggregates."""
+        self._seed_student(student_id)
+        return self.aggregates.summary(student_id)
+
+    def leaderboard(self, n=10, min_topics=1):
+        return self.aggregates.leaderboard(n, min_topics)
+
+    def confidence_distribution(self):
+        return self.aggregates.distribution()
 
     def expected_confidence_gain(self, student_id, topic):
-        student_history = self.generate_confidence_scores(student_id)
-        current = student_history.loc[student_history['topic'] == topic, 'confidence']
-        curr_val = int(current.values[0]) if not current.empty else 0
+        self.generate_confidence_scores(student_id)
+        curr_val = self.index.get(student_id, topic)
         gain = random.randint(5, 15)
         return min(curr_val + gain, 100)
 
     def update_confidence(self, student_id, topic, gain):
-        idx = self.history[(self.history['student_id'] == student_id) & (self.history['topic'] == topic)].index
-        if not idx.empty:
-            self.history.loc[idx, 'confidence'] = min(self.history.loc[idx, 'confidence'] + gain, 100)
-        else:
-            self.history.loc[len(self.history)] = [student_id, topic, min(gain, 100)]
-        self.history.to_csv("data/history.csv", index=False)
+        current = self.index.get(student_id, topic)
+        self._set_confidence(student_id, topic, min(current + gain, 100))
+
+    def apply_confidence_gains(self, events):
+        """
+        update_confidence for a batch. `events` is a DataFrame with
+        student_id, topic and gain columns; gains for the same (student,
+        topic) are summed and applied once, so the result matches applying
+        non-negative gains one at a time. Returns the number of confidences
+        written. Raises ValueError, before writing anything, if an event names
+        a topic the data doesn't know.
+        """
+        if events.empty:
+            return 0
+        unknown = [t for t in pd.unique(events['topic']).tolist() if t not in self.topic_ids]
+        if unknown:
+            raise ValueError(f"{len(unknown)} unknown topics (first is {unknown[0]!r})")
+        batch = events.groupby(['student_id', 'topic'], sort=False)['gain'].sum().reset_index()
+        student_ids = batch['student_id'].astype('int64').tolist()
+        topics = batch['topic'].tolist()
+        with self.writer:
+            old = [self.index.get(s, t, None) for s, t in zip(student_ids, topics)]
+            current = np.array([0 if c is None else c for c in old], dtype=np.int64)
+            confidences = np.clip(current + batch['gain'].to_numpy(dtype=np.int64), 0, 100).tolist()
+            self.index.set_many(student_ids, topics, confidences)
+            for student_id, before, after in zip(student_ids, old, confidences):
+                self.aggregates.update(student_id, before, after)
+            # an ingested batch always refreshes the peer snapshot
+            self._peer_writes += PEER_REFRESH_WRITES
+            self.store.record_confidences(zip(student_ids, topics, confidences))
+            for student_id in set(student_ids):
+                self.invalidate(student_id)
+        return len(topics)
 
     # ---------------- Study Plan ----------------
+    def set_study_plan(self, plan):
+        study_plan = pd.DataFrame(plan)
+        with self.writer:
+            self.study_plan = study_plan
+
     def get_study_plan(self):
-        if not self.study_plan.empty:
-            return self.study_plan.to_dict(orient="records")
+        study_plan = self.study_plan
+        if not study_plan.empty:
+            return study_plan.to_dict(orient="records")
         return []
 
     # ---------------- Badges ----------------
     def get_badges(self, student_id):
-        student_history = self.generate_confidence_scores(student_id)
+        summary = self.student_summary(student_id)
         badges = []
-        strong_count = (student_history['confidence'] >= 80).sum()
-        weak_count = (student_history['confidence'] < 50).sum()
-        high_achiever = (student_history['confidence'] >= 90).any()
 
-        if strong_count >= 3:
+        if summary["strong"] >= 3:
             badges.append("Consistency Star ⭐")
-        if weak_count == 0:
+        if summary["weak"] == 0:
             badges.append("Improvement Badge 📈")
-        if high_achiever:
+        if summary["high"] > 0:
             badges.append("High Achiever 🏆")
 
         return badges
 
     # ---------------- Save ----------------
-    def save(self, student_data_path="data/student_data.csv", history_path="data/history.csv"):
-        self.student_data.to_csv(student_data_path, index=False)
-        self.history.to_csv(history_path, index=False)
-        if not self.study_plan.empty:
-            self.study_plan.to_csv("data/study_plan.csv", index=False)
+    def save(self, student_data_path=None, history_path=None):
+        with self.writer:
+            self.invalidate()
+            if student_data_path is None or student_data_path == self.student_data_path:
+                self.store.save_student_data(self.student_data)
+            else:
+                self.student_data.to_csv(student_data_path, index=False)
+            if history_path is None or history_path == self.history_path:
+                self.store.save_history()
+            else:
+                self.history.to_csv(history_path, index=False)
+            self.save_study_plan()
+
+    def save_study_plan(self):
+        with self.writer:
+            if not self.study_plan.empty:
+                self.store.save_study_plan(self.study_plan)
+
+    def close(self):
+        """Flush pending history writes into the store and release it."""
+        with self.writer:
+            self.store.close()
@@ -0,0 +1,82 @@
+import pandas as pd
+
+# possible column names in resources.csv
+YOUTUBE_COLUMNS = ["youtube", "youtube_link", "youtube_url", "yt", "video"]
+DOCS_COLUMNS = ["docs", "documentation_link", "documentation", "docs_link", "documentation_url", "doc"]
+
+EMPTY = {"youtube": "", "docs": ""}
+
+# optional column: hours a topic takes to study, used by the study-plan scheduler
+ESTIMATE_COLUMN = "estimated_hours"
+
+
+def clean_url(url):
+    """Return empty string if falsy. Ensure url starts with http:// or https://"""
+    if not url or (isinstance(url, float) and pd.isna(url)):
+        return ""
+    u = str(url).strip()
+    if not u or u.startswith("http://") or u.startswith("https://"):
+        return u
+    return "https://" + u.lstrip('/')
+
+
+def _first_link(row, columns):
+    for col in columns:
+        value = row.get(col)
+        if value is not None and pd.notna(value) and str(value).strip() != "":
+            return clean_url(value)
+    return ""
+
+
+def build_resource_map(df):
+    """
+    Resolve the resources table once into topic -> {"youtube", "docs"} with
+    cleaned URLs. The first row for a topic wins.
+    """
+    resource_map = {}
+    if df is None or df.empty or "topic" not in df.columns:
+        return resource_map
+    youtube_cols = [c for c in YOUTUBE_COLUMNS if c in df.columns]
+    docs_cols = [c for c in DOCS_COLUMNS if c in df.columns]
+    for row in df[["topic"] + youtube_cols + docs_cols].to_dict(orient="records"):
+        topic = row["topic"]
+        if topic in resource_map:
+            continue
+        resource_map[topic] = {
+            "youtube": _first_link(row, youtube_cols),
+            "docs": _first_link(row, docs_cols),
+        }
+    return resource_map
+
+
+def build_estimates(df):
+    """topic -> estimated hours from the optional estimated_hours column (first positive value wins)."""
+    if df is None or df.empty or "topic" not in df.columns or ESTIMATE_COLUMN not in df.columns:
+        return {}
+    hours = pd.to_numeric(df[ESTIMATE_COLUMN], errors="coerce")
+    rows = df.loc[hours > 0, "topic"].to_frame().assign(hours=hours[hours > 0])
+    rows = rows[~rows["topic"].duplicated()]
+    return dict(zip(rows["topic"].tolist(), rows["hours"].tolist()))
+
+
+def canonical_resources(df):
+    """
+    The resources table as (topic, youtube_link, documentation_link,
+    estimated_hours), from whichever of the column names above it uses;
+    per row the first non-empty one wins, as in build_resource_map (URLs
+    are left as they are).
+    """
+    def first(columns):
+        columns = [c for c in columns if c in df.columns]
+        if not columns:
+            return pd.Series(None, index=df.index, dtype=object)
+        links = df[columns].astype(object)
+        links = links.where(links.notna() & (links.astype(str).apply(lambda col: col.str.strip()) != ""))
+        return links.bfill(axis=1).iloc[:, 0]
+
+    return pd.DataFrame({
+        "topic": df["topic"],
+        "youtube_link": first(YOUTUBE_COLUMNS),
+        "documentation_link": first(DOCS_COLUMNS),
+        ESTIMATE_COLUMN: pd.to_numeric(df[ESTIMATE_COLUMN], errors="coerce") if ESTIMATE_COLUMN in df.columns else None,
+    })
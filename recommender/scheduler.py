@@ -0,0 +1,79 @@
+import heapq
+from datetime import timedelta
+
+
+def prerequisite_order(topics, graph):
+    """
+    Order `topics` so every topic comes after its prerequisites, including
+    ones reached through topics that were not selected. Ties keep the order
+    the topics were given in. Topics caught in a cycle are appended in
+    their original order.
+    """
+    position = {}
+    for topic in topics:
+        position.setdefault(topic, len(position))
+
+    # prerequisite sub-graph reachable from the selection, walked once
+    prereqs = {}
+    stack = list(position)
+    while stack:
+        topic = stack.pop()
+        if topic in prereqs:
+            continue
+        prereqs[topic] = graph.related(topic, "prerequisite")
+        stack.extend(p for p in prereqs[topic] if p not in prereqs)
+
+    pending = {topic: len(deps) for topic, deps in prereqs.items()}
+    unlocks = {}
+    for topic, deps in prereqs.items():
+        for dep in deps:
+            unlocks.setdefault(dep, []).append(topic)
+
+    # unselected topics sort after selected ones but still release their dependants
+    def key(topic):
+        return (position.get(topic, len(position)), topic)
+
+    heap = [key(t) for t, n in pending.items() if n == 0]
+    heapq.heapify(heap)
+    ordered = []
+    while heap:
+        _, topic = heapq.heappop(heap)
+        if topic in position:
+            ordered.append(topic)
+        for nxt in unlocks.get(topic, []):
+            pending[nxt] -= 1
+            if pending[nxt] == 0:
+                heapq.heappush(heap, key(nxt))
+
+    placed = set(ordered)
+    ordered.extend(t for t in position if t not in placed)
+    return ordered
+
+
+def schedule_topics(topics, graph, start_date, hours_per_day, estimated_hours=None):
+    """
+    Pack topics into consecutive days in prerequisite order. Each topic takes
+    estimated_hours[topic] hours (default: one full day) and is split across
+    days when it does not fit in what is left of the current one.
+    Returns [{'date', 'topic', 'hours'}, ...].
+    """
+    capacity = max(int(hours_per_day), 1)
+    estimated_hours = estimated_hours or {}
+    plan = []
+    day = 0
+    left = capacity
+    for topic in prerequisite_order(topics, graph):
+        need = max(int(estimated_hours.get(topic, capacity)), 1)
+        while need > 0:
+            if left == 0:
+                day += 1
+                left = capacity
+            chunk = min(need, left)
+            plan.append({
+                'date': (start_date + timedelta(days=day)).strftime("%Y-%m-%d"),
+                'topic': topic,
+                'hours': chunk
+            })
+            need -= chunk
+            left -= chunk
+    return plan
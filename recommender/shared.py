@@ -0,0 +1,424 @@
+"""
+History shared between worker processes through memory-mapped arrays.
+
+The history table is compiled into two numpy arrays in `shared_dir`:
+sorted int64 keys (student_id * width + topic code) and uint8
+confidences. Every worker maps them read-only, so the OS keeps one copy
+in the page cache no matter how many workers run.
+
+Writes still go to the history journal, appended immediately under a file
+lock. Each worker tails the journal (from its last offset) into a small
+per-process overlay on every sync(); a sync that finds meta.json and the
+journal unchanged since the last one (by stat) returns without the lock. Compaction folds everything back into
+history.csv, compiles a new generation of arrays and bumps the generation
+in meta.json; workers notice the new generation, remap and drop their
+overlays.
+"""
+import os
+import csv
+import atexit
+import json
+import fcntl
+import threading
+import numpy as np
+import pandas as pd
+from recommender.journal import HistoryJournal
+from recommender.storage import CsvStore, SNAPSHOT_TABLES
+
+META = "meta.json"
+
+
+class FileLock:
+    """Process-wide, re-entrant exclusive lock on a file (flock)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._fd = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0:
+            self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc):
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._lock.release()
+
+
+def file_stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def read_meta(shared_dir):
+    try:
+        with open(os.path.join(shared_dir, META)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_array(path, array):
+    # written aside and renamed in, so a worker mapping an older file keeps its inode
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def build_arrays(shared_dir, history, source_stamp):
+    """
+    Compile a history frame into a new generation of mapped arrays. The
+    caller holds the file lock; the generation number comes from meta.json,
+    not from the caller's mapped generation, which may be behind.
+    """
+    meta = read_meta(shared_dir)
+    generation = meta["generation"] + 1 if meta else 1
+    history = history[~history.duplicated(["student_id", "topic"])]
+    topics = pd.unique(history["topic"]).tolist()
+    width = max(len(topics), 1)
+    codes = pd.Categorical(history["topic"], categories=topics).codes.astype(np.int64)
+    keys = history["student_id"].to_numpy(dtype=np.int64) * width + codes
+    order = np.argsort(keys, kind="stable")
+    conf = np.clip(history["confidence"].to_numpy(), 0, 100).astype(np.uint8)
+
+    prefix = f"history-{generation}"
+    _save_array(os.path.join(shared_dir, prefix + ".keys.npy"), keys[order])
+    _save_array(os.path.join(shared_dir, prefix + ".conf.npy"), conf[order])
+    meta = {
+        "generation": generation,
+        "source": source_stamp,
+        "width": width,
+        "topics": topics,
+        "prefix": prefix,
+    }
+    tmp_path = os.path.join(shared_dir, META + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(shared_dir, META))
+
+    # mapped files stay readable for workers still holding them
+    for name in os.listdir(shared_dir):
+        if name.startswith("history-") and not name.startswith(prefix + "."):
+            os.remove(os.path.join(shared_dir, name))
+    return meta
+
+
+class _Generation:
+    """One mapped generation of the shared arrays."""
+
+    def __init__(self, shared_dir, meta):
+        self.number = meta["generation"]
+        self.width = meta["width"]
+        self.names = meta["topics"]
+        self.codes = {topic: i for i, topic in enumerate(self.names)}
+        prefix = os.path.join(shared_dir, meta["prefix"])
+        self.keys = np.load(prefix + ".keys.npy", mmap_mode="r")
+        self.conf = np.load(prefix + ".conf.npy", mmap_mode="r")
+        self.global_ids = None
+
+    def student_range(self, student_id):
+        lo = np.searchsorted(self.keys, student_id * self.width, side="left")
+        hi = np.searchsorted(self.keys, (student_id + 1) * self.width, side="left")
+        return int(lo), int(hi)
+
+    def get(self, student_id, topic):
+        code = self.codes.get(topic)
+        if code is None:
+            return None
+        key = student_id * self.width + code
+        i = int(np.searchsorted(self.keys, key))
+        if i < len(self.keys) and self.keys[i] == key:
+            return int(self.conf[i])
+        return None
+
+
+class SharedHistoryIndex:
+    """
+    HistoryIndex over the mapped arrays plus a per-process overlay of newer
+    writes. Like HistoryIndex it is copy-on-write: the (generation, overlay)
+    pair and each student's overlay dict are replaced, never edited, so
+    readers don't lock. sync() and set() must be serialised by the caller.
+    """
+
+    def __init__(self, shared_dir, journal_path, file_lock, compact):
+        self.shared_dir = shared_dir
+        self.journal_path = journal_path
+        self.file_lock = file_lock
+        self._compact = compact
+        self._offset = 0
+        self._seen = None
+        self._state = (_Generation(shared_dir, read_meta(shared_dir)), {})
+
+    @property
+    def generation(self):
+        return self._state[0].number
+
+    # ---------------- Sync ----------------
+    def _files_stamp(self):
+        """(inode, mtime, size) of meta.json and the journal; any append or compaction changes it."""
+        stamp = []
+        for path in (os.path.join(self.shared_dir, META), self.journal_path):
+            try:
+                st = os.stat(path)
+                stamp.append((st.st_ino, st.st_mtime_ns, st.st_size))
+            except OSError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def needs_sync(self):
+        """Lock-free check for anything written since the last sync()."""
+        return self._files_stamp() != self._seen
+
+    def sync(self):
+        """
+        Pick up other processes' writes. Returns the changed student ids,
+        or None when a new generation was mapped and everything may differ.
+        """
+        if not self.needs_sync():
+            return set()
+        # under the lock so a compaction can't swap the journal mid-read
+        with self.file_lock:
+            # stamped before reading, so a write landing mid-read is picked up next time
+            self._seen = self._files_stamp()
+            meta = read_meta(self.shared_dir)
+            if meta is not None and meta["generation"] != self.generation:
+                base, overlay = _Generation(self.shared_dir, meta), {}
+                self._offset = 0
+                self._tail_journal(overlay)
+                self._state = (base, overlay)
+                return None
+            return self._tail_journal(self._state[1])
+
+    def _tail_journal(self, overlay):
+        try:
+            size = os.path.getsize(self.journal_path)
+        except OSError:
+            return set()
+        if size <= self._offset:
+            return set()
+        with open(self.journal_path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read(size - self._offset)
+        end = chunk.rfind(b"\n") + 1
+        if not end:
+            return set()
+        self._offset += end
+        changed = {}
+        for row in csv.reader(chunk[:end].decode("utf-8").splitlines()):
+            if len(row) == 3:
+                sid = int(row[0])
+                student = changed.get(sid)
+                if student is None:
+                    student = changed[sid] = dict(overlay.get(sid, {}))
+                student[row[1]] = int(float(row[2]))
+        overlay.update(changed)
+        return set(changed)
+
+    # ---------------- Lookups ----------------
+    def get(self, student_id, topic, default=0):
+        base, overlay = self._state
+        student = overlay.get(student_id)
+        if student is not None and topic in student:
+            return student[topic]
+        value = base.get(student_id, topic)
+        return default if value is None else value
+
+    def contains(self, student_id, topic):
+        base, overlay = self._state
+        return topic in overlay.get(student_id, {}) or base.get(student_id, topic) is not None
+
+    def topics(self, student_id):
+        base, overlay = self._state
+        lo, hi = base.student_range(student_id)
+        codes = (np.asarray(base.keys[lo:hi]) - student_id * base.width).tolist()
+        result = dict(zip((base.names[c] for c in codes), np.asarray(base.conf[lo:hi]).tolist()))
+        result.update(overlay.get(student_id, {}))
+        return result
+
+    @staticmethod
+    def _global_ids(base, topic_ids):
+        """topic_ids' ids for the generation's topic codes."""
+        if base.global_ids is None or base.global_ids[0] is not topic_ids:
+            base.global_ids = (topic_ids, topic_ids.encode(base.names))
+        return base.global_ids[1]
+
+    def confidence_vector(self, student_id, topic_ids):
+        """Dense uint8 confidences over topic_ids' interned topics (0 where unknown)."""
+        base, overlay = self._state
+        global_ids = self._global_ids(base, topic_ids)
+        extra = [(topic_ids.intern(t), c) for t, c in overlay.get(student_id, {}).items()]
+        vec = np.zeros(len(topic_ids), dtype=np.uint8)
+        lo, hi = base.student_range(student_id)
+        if hi > lo:
+            codes = np.asarray(base.keys[lo:hi]) - student_id * base.width
+            vec[global_ids[codes]] = base.conf[lo:hi]
+        for code, conf in extra:
+            vec[code] = conf
+        return vec
+
+    def arrays(self, topic_ids):
+        """(student_ids, topic ids, confidences) as int64 arrays, one entry per (student, topic)."""
+        base, overlay = self._state
+        keys = np.asarray(base.keys)
+        students = keys // base.width
+        topics = self._global_ids(base, topic_ids).astype(np.int64)[keys % base.width]
+        conf = np.asarray(base.conf).astype(np.int64)
+        rows = [(sid, topic_ids.intern(t), c) for sid, student in list(overlay.items()) for t, c in student.items()]
+        if rows:
+            extra = np.array(rows, dtype=np.int64)
+            # overlay entries replace the mapped ones for the same (student, topic)
+            n = len(topic_ids)
+            keep = ~np.isin(students * n + topics, extra[:, 0] * n + extra[:, 1])
+            students = np.concatenate((students[keep], extra[:, 0]))
+            topics = np.concatenate((topics[keep], extra[:, 1]))
+            conf = np.concatenate((conf[keep], extra[:, 2]))
+        return students, topics, conf
+
+    # ---------------- Mutation ----------------
+    def set(self, student_id, topic, confidence):
+        overlay = self._state[1]
+        student = dict(overlay.get(student_id, {}))
+        student[topic] = int(confidence)
+        overlay[student_id] = student
+
+    def set_many(self, student_ids, topics, confidences):
+        overlay = self._state[1]
+        batch = {}
+        for sid, topic, conf in zip(student_ids, topics, confidences):
+            student = batch.get(sid)
+            if student is None:
+                student = batch[sid] = dict(overlay.get(sid, {}))
+            student[topic] = int(conf)
+        overlay.update(batch)
+
+    def rebuild(self, history):
+        """Replace the shared history for every worker: compacts `history` into a new generation."""
+        self._compact(history)
+
+    def to_frame(self):
+        base, overlay = self._state
+        keys = np.asarray(base.keys)
+        names = np.asarray(base.names, dtype=object)
+        frame = pd.DataFrame({
+            "student_id": keys // base.width,
+            "topic": names[keys % base.width] if len(names) else np.array([], dtype=object),
+            "confidence": np.asarray(base.conf).astype(np.int64),
+        })
+        rows = [(sid, t, c) for sid, student in list(overlay.items()) for t, c in student.items()]
+        if rows:
+            frame = pd.concat([frame, pd.DataFrame(rows, columns=frame.columns)], ignore_index=True)
+            frame = frame.drop_duplicates(["student_id", "topic"], keep="last").reset_index(drop=True)
+        return frame
+
+    def __len__(self):
+        base, overlay = self._state
+        extra = sum(1 for sid, student in list(overlay.items())
+                    for t in student if base.get(sid, t) is None)
+        return len(base.keys) + extra
+
+
+class SharedJournal(HistoryJournal):
+    """
+    Journal appended to by every worker. Appends and compactions are
+    serialised with the shared file lock; compaction is delegated to the
+    store, which rebuilds the mapped arrays.
+    """
+
+    def __init__(self, snapshot_path, file_lock, compactor, **kwargs):
+        self.file_lock = file_lock
+        self.compactor = compactor
+        super().__init__(snapshot_path, snapshot_source=None, **kwargs)
+
+    def _append_pending(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        with open(self.journal_path, "a", newline="") as f:
+            csv.writer(f).writerows(self._pending)
+        self._journal_rows += len(self._pending)
+        self._pending = []
+
+    def flush(self):
+        with self._lock, self.file_lock:
+            self._append_pending()
+            if self._journal_rows >= self.compact_every:
+                self.compact()
+
+    def compact(self, history=None):
+        """Fold the journal into a new generation, or replace the whole table with `history`."""
+        with self._lock, self.file_lock:
+            self._append_pending()
+            self.compactor(history)
+            self._journal_rows = 0
+
+    def close(self):
+        # other workers may still be running; compaction is left to save()
+        self.flush()
+        atexit.unregister(self.flush)
+
+
+class SharedCsvStore(CsvStore):
+    """
+    CsvStore whose history lives in memory-mapped arrays shared by every
+    worker process (see module docstring). The smaller tables are still
+    loaded per process.
+    """
+
+    tables = [name for name in SNAPSHOT_TABLES if name != "history"]
+
+    def __init__(self, paths, history_source, shared_dir, read_study_plan=False, snapshot_path=None):
+        self.shared_dir = shared_dir
+        os.makedirs(shared_dir, exist_ok=True)
+        self.file_lock = FileLock(os.path.join(shared_dir, "lock"))
+        self.index = None
+        super().__init__(paths, history_source, read_study_plan, snapshot_path)
+
+    def _make_journal(self, history_source):
+        # append every write right away so other workers see it on their next sync
+        return SharedJournal(self.paths["history"], self.file_lock, self._compact, flush_every=1, flush_interval=0)
+
+    def load(self):
+        with self.file_lock:
+            meta = read_meta(self.shared_dir)
+            source = file_stamp(self.paths["history"])
+            if meta is None or meta["source"] != source:
+                build_arrays(self.shared_dir, pd.read_csv(self.paths["history"]), source)
+            # mapped under the lock, before a compaction elsewhere can remove the files
+            self.index = SharedHistoryIndex(self.shared_dir, self.journal.journal_path, self.file_lock,
+                                            self.journal.compact)
+            self.index.sync()
+        data = super().load()
+        data["history"] = None
+        data["index"] = self.index
+        return data
+
+    def needs_sync(self):
+        return self.index.needs_sync()
+
+    def sync(self):
+        return self.index.sync()
+
+    def _compact(self, history=None):
+        # called with the file lock held and every write already in the journal
+        if history is None:
+            self.index.sync()
+            history = self.index.to_frame()
+        tmp_path = self.paths["history"] + ".tmp"
+        history.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.paths["history"])
+        if os.path.exists(self.journal.journal_path):
+            os.remove(self.journal.journal_path)
+        build_arrays(self.shared_dir, history, file_stamp(self.paths["history"]))
+        self.index.sync()
@@ -0,0 +1,448 @@
+"""
+Storage backends for the Recommender.
+
+Both backends load the five learning tables as DataFrames and persist
+changes made through the Recommender:
+
+    CsvStore     - the CSV files under data/, history writes go through
+                   the write-behind journal.
+    SqliteStore  - indexed SQLite tables in WAL mode. History stays in the
+                   database: lookups are indexed queries and writes
+                   row-level upserts (SqliteHistoryIndex). CSVs can be
+                   imported/exported:
+
+        python -m recommender.storage import --db data/learning.db --data-dir data
+        python -m recommender.storage export --db data/learning.db --data-dir data
+"""
+import os
+import pickle
+import argparse
+import sqlite3
+import threading
+import weakref
+import numpy as np
+import pandas as pd
+from recommender.journal import HistoryJournal
+from recommender.resources import canonical_resources
+
+TABLES = ["topic_graph", "student_data", "history", "resources", "study_plan"]
+SNAPSHOT_TABLES = ["topic_graph", "student_data", "history", "resources"]
+SNAPSHOT_FORMAT = 2
+
+
+def csv_paths(data_dir):
+    return {name: os.path.join(data_dir, name + ".csv") for name in TABLES}
+
+
+# ---------------- CSV ----------------
+class CsvStore:
+    """
+    With snapshot_path set, the parsed tables are also pickled there and
+    reused on the next start as long as the source CSVs are unchanged
+    (same mtime and size) and pandas is the same version, which skips CSV
+    parsing on cold start.
+    """
+
+    tables = SNAPSHOT_TABLES
+
+    def __init__(self, paths, history_source, read_study_plan=False, snapshot_path=None):
+        self.paths = paths
+        self.read_study_plan = read_study_plan
+        self.snapshot_path = snapshot_path
+        self.journal = self._make_journal(history_source)
+
+    def _make_journal(self, history_source):
+        return HistoryJournal(self.paths["history"], history_source)
+
+    def load(self):
+        data = self._load_snapshot() if self.snapshot_path else None
+        if data is None:
+            data = {name: pd.read_csv(self.paths[name]) for name in self.tables}
+            if "history" in data:
+                data["history"]["student_id"] = data["history"]["student_id"].astype(int)
+            if self.snapshot_path:
+                self._write_snapshot(data)
+        if "history" in data:
+            data["history"] = self.journal.replay(data["history"])
+        # the study plan is only loaded when the caller asked for one
+        data["study_plan"] = pd.read_csv(self.paths["study_plan"]) if self.read_study_plan else pd.DataFrame()
+        return data
+
+    def load_resources(self):
+        return pd.read_csv(self.paths["resources"])
+
+    # ---------------- Snapshot ----------------
+    def _source_stamp(self):
+        stamp = [SNAPSHOT_FORMAT, pd.__version__]
+        for name in self.tables:
+            st = os.stat(self.paths[name])
+            stamp.append((name, st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+    def _load_snapshot(self):
+        # the stamp is pickled ahead of the data, so stale data is never unpickled;
+        # anything that goes wrong reading it (truncated file, pickle from another
+        # pandas/numpy build, ...) is just a cache miss
+        try:
+            with open(self.snapshot_path, "rb") as f:
+                if pickle.load(f) != self._source_stamp():
+                    return None
+                return pickle.load(f)
+        except Exception:
+            return None
+
+    def _write_snapshot(self, data):
+        tmp_path = self.snapshot_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump(self._source_stamp(), f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError:
+            # a read-only deploy just parses the CSVs every time
+            pass
+
+    def resources_mtime(self):
+        try:
+            return os.path.getmtime(self.paths["resources"])
+        except OSError:
+            return None
+
+    def record_confidence(self, student_id, topic, confidence):
+        self.journal.record(student_id, topic, confidence)
+
+    def record_confidences(self, rows):
+        self.journal.record_many(rows)
+
+    def needs_sync(self):
+        """Cheap, lock-free check whether sync() could find anything."""
+        return False
+
+    def sync(self):
+        """Student ids changed by other processes since the last call (None: everything)."""
+        return set()
+
+    def save_history(self):
+        self.journal.compact()
+
+    def save_student_data(self, student_data):
+        student_data.to_csv(self.paths["student_data"], index=False)
+
+    def load_study_plan(self):
+        if not os.path.exists(self.paths["study_plan"]):
+            return None
+        return pd.read_csv(self.paths["study_plan"])
+
+    def study_plan_stamp(self):
+        """(mtime_ns, size) of the saved plan, None if there is none."""
+        try:
+            st = os.stat(self.paths["study_plan"])
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def save_study_plan(self, study_plan):
+        study_plan.to_csv(self.paths["study_plan"], index=False)
+
+    def close(self):
+        self.journal.close()
+
+
+# ---------------- SQLite ----------------
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS topic_graph (
+    topic TEXT NOT NULL,
+    relation TEXT,
+    related_topic TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_topic_graph_topic ON topic_graph (topic);
+CREATE TABLE IF NOT EXISTS student_data (
+    student_id INTEGER PRIMARY KEY,
+    completed_topics TEXT
+);
+CREATE TABLE IF NOT EXISTS history (
+    student_id INTEGER NOT NULL,
+    topic TEXT NOT NULL,
+    confidence INTEGER NOT NULL,
+    UNIQUE (student_id, topic)
+);
+CREATE TABLE IF NOT EXISTS resources (
+    topic TEXT PRIMARY KEY,
+    youtube_link TEXT,
+    documentation_link TEXT,
+    estimated_hours REAL
+);
+CREATE TABLE IF NOT EXISTS study_plan (
+    date TEXT,
+    topic TEXT,
+    hours INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# bumped in the same transaction as every study_plan write, by any process
+BUMP_PLAN_REVISION = (
+    "INSERT INTO meta (key, value) VALUES ('study_plan_revision', 1) "
+    "ON CONFLICT(key) DO UPDATE SET value=value + 1"
+)
+
+
+class _Reader:
+    """One thread's read connection; closed when the holder is collected."""
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        weakref.finalize(self, self.conn.close)
+
+
+UPSERT_HISTORY = (
+    "INSERT INTO history (student_id, topic, confidence) VALUES (?, ?, ?) "
+    "ON CONFLICT(student_id, topic) DO UPDATE SET confidence=excluded.confidence"
+)
+
+
+class SqliteHistoryIndex:
+    """
+    HistoryIndex over the history table itself: lookups are queries on the
+    (student_id, topic) index and writes are upserts, so nothing per history
+    row is held in memory. Readers use one connection per thread (WAL lets
+    them run alongside the writer and see each committed write); writes go
+    through the store's connection and must be serialised by the caller
+    like HistoryIndex's. A student's topics come back in the order they
+    were first written (rowid order).
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._local = threading.local()
+        # weak, so a reader is closed once its thread's local storage goes away
+        self._readers = weakref.WeakSet()
+
+    def _reader(self):
+        reader = getattr(self._local, "reader", None)
+        if reader is None:
+            reader = self._local.reader = _Reader(self.store.db_path)
+            self._readers.add(reader)
+        return reader.conn
+
+    def _student_rows(self, student_id):
+        return self._reader().execute(
+            "SELECT topic, confidence FROM history WHERE student_id=? ORDER BY rowid", (int(student_id),)
+        ).fetchall()
+
+    # ---------------- Lookups ----------------
+    def get(self, student_id, topic, default=0):
+        row = self._reader().execute(
+            "SELECT confidence FROM history WHERE student_id=? AND topic=?", (int(student_id), topic)
+        ).fetchone()
+        return row[0] if row else default
+
+    def contains(self, student_id, topic):
+        return self.get(student_id, topic, None) is not None
+
+    def topics(self, student_id):
+        return dict(self._student_rows(student_id))
+
+    def confidence_vector(self, student_id, topic_ids):
+        """Dense uint8 confidences over topic_ids' interned topics (0 where unknown)."""
+        rows = self._student_rows(student_id)
+        codes = [topic_ids.intern(topic) for topic, _ in rows]
+        vec = np.zeros(len(topic_ids), dtype=np.uint8)
+        if rows:
+            vec[codes] = [conf for _, conf in rows]
+        return vec
+
+    def arrays(self, topic_ids):
+        """(student_ids, topic ids, confidences) as int64 arrays, one entry per (student, topic)."""
+        history = self.to_frame()
+        return (history["student_id"].to_numpy(dtype=np.int64),
+                topic_ids.encode(history["topic"]).astype(np.int64),
+                history["confidence"].to_numpy(dtype=np.int64))
+
+    def to_frame(self):
+        return pd.read_sql_query("SELECT student_id, topic, confidence FROM history ORDER BY rowid", self._reader())
+
+    def __len__(self):
+        return self._reader().execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+    # ---------------- Mutation ----------------
+    def set(self, student_id, topic, confidence):
+        self.set_many([student_id], [topic], [confidence])
+
+    def set_many(self, student_ids, topics, confidences):
+        rows = [(int(sid), topic, min(max(int(conf), 0), 100))
+                for sid, topic, conf in zip(student_ids, topics, confidences)]
+        with self.store._lock, self.store.conn:
+            self.store.conn.executemany(UPSERT_HISTORY, rows)
+
+    def rebuild(self, history):
+        with self.store._lock, self.store.conn:
+            self.store.conn.execute("DELETE FROM history")
+            # first row wins, like HistoryIndex.rebuild
+            self.store.conn.executemany(
+                "INSERT OR IGNORE INTO history (student_id, topic, confidence) VALUES (?, ?, ?)",
+                ((int(sid), topic, min(max(int(conf), 0), 100)) for sid, topic, conf in
+                 zip(history["student_id"], history["topic"], history["confidence"]))
+            )
+
+    def close(self):
+        for reader in list(self._readers):
+            reader.conn.close()
+
+
+class SqliteStore:
+    def __init__(self, db_path, import_paths=None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        if import_paths and self.is_empty():
+            self.import_csv(import_paths)
+        self.index = SqliteHistoryIndex(self)
+
+    def _migrate(self):
+        # databases created before resources had an estimated_hours column
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(resources)")]
+        if "estimated_hours" not in columns:
+            with self._lock, self.conn:
+                self.conn.execute("ALTER TABLE resources ADD COLUMN estimated_hours REAL")
+
+    def is_empty(self):
+        row = self.conn.execute(
+            "SELECT (SELECT COUNT(*) FROM student_data) + (SELECT COUNT(*) FROM history)"
+        ).fetchone()
+        return row[0] == 0
+
+    # ---------------- Load ----------------
+    def load(self):
+        # history is not loaded: the Recommender queries it through the index
+        data = {
+            "topic_graph": pd.read_sql_query("SELECT topic, relation, related_topic FROM topic_graph ORDER BY rowid", self.conn),
+            "student_data": pd.read_sql_query("SELECT student_id, completed_topics FROM student_data ORDER BY rowid", self.conn),
+            "history": None,
+            "index": self.index,
+            "resources": self.load_resources(),
+            "study_plan": self.load_study_plan(),
+        }
+        if data["study_plan"] is None:
+            data["study_plan"] = pd.DataFrame()
+        return data
+
+    def load_study_plan(self):
+        plan = pd.read_sql_query("SELECT date, topic, hours FROM study_plan ORDER BY rowid", self.conn)
+        return None if plan.empty else plan
+
+    def study_plan_stamp(self):
+        """(revision, rows) of the saved plan, None if there is none; sees other processes' saves."""
+        revision, count = self.conn.execute(
+            "SELECT (SELECT value FROM meta WHERE key='study_plan_revision'), (SELECT COUNT(*) FROM study_plan)"
+        ).fetchone()
+        return (revision or 0, count) if count else None
+
+    def load_resources(self):
+        return pd.read_sql_query(
+            "SELECT topic, youtube_link, documentation_link, estimated_hours FROM resources ORDER BY rowid", self.conn
+        )
+
+    def resources_mtime(self):
+        # the table only changes through this process or an explicit import
+        return None
+
+    def needs_sync(self):
+        return False
+
+    def sync(self):
+        return set()
+
+    # ---------------- Writes ----------------
+    def record_confidence(self, student_id, topic, confidence):
+        # already upserted by SqliteHistoryIndex.set
+        pass
+
+    def record_confidences(self, rows):
+        # already upserted by SqliteHistoryIndex.set_many
+        pass
+
+    def save_history(self):
+        # every change was already upserted by the index
+        pass
+
+    def save_student_data(self, student_data):
+        rows = [
+            (int(sid), None if pd.isna(topics) else topics)
+            for sid, topics in zip(student_data["student_id"], student_data["completed_topics"])
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT INTO student_data (student_id, completed_topics) VALUES (?, ?) "
+                "ON CONFLICT(student_id) DO UPDATE SET completed_topics=excluded.completed_topics",
+                rows
+            )
+
+    def save_study_plan(self, study_plan):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM study_plan")
+            self.conn.executemany(
+                "INSERT INTO study_plan (date, topic, hours) VALUES (?, ?, ?)",
+                study_plan[["date", "topic", "hours"]].astype(object).itertuples(index=False, name=None)
+            )
+            self.conn.execute(BUMP_PLAN_REVISION)
+
+    def close(self):
+        self.index.close()
+        self.conn.close()
+
+    # ---------------- CSV import / export ----------------
+    def import_csv(self, paths):
+        """Load CSVs into the tables, replacing their current contents."""
+        frames = {name: pd.read_csv(path) for name, path in paths.items()
+                  if name in TABLES and path and os.path.exists(path)}
+        if "resources" in frames:
+            # any of the link column names build_resource_map accepts
+            frames["resources"] = canonical_resources(frames["resources"])
+        with self._lock, self.conn:
+            for name, df in frames.items():
+                self.conn.execute(f"DELETE FROM {name}")
+                columns = ", ".join(df.columns)
+                marks = ", ".join("?" for _ in df.columns)
+                # first row wins on duplicate keys, like the in-memory lookups
+                self.conn.executemany(
+                    f"INSERT OR IGNORE INTO {name} ({columns}) VALUES ({marks})",
+                    df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+                )
+            if "study_plan" in frames:
+                self.conn.execute(BUMP_PLAN_REVISION)
+
+    def export_csv(self, data_dir):
+        os.makedirs(data_dir, exist_ok=True)
+        for name in TABLES:
+            df = pd.read_sql_query(f"SELECT * FROM {name} ORDER BY rowid", self.conn)
+            if not df.empty:
+                df.to_csv(os.path.join(data_dir, name + ".csv"), index=False)
+
+
+def main(argv=None):
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description="Move learning data between CSV files and SQLite.")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("--db", default=os.path.join(base_dir, "data", "learning.db"))
+    parser.add_argument("--data-dir", default=os.path.join(base_dir, "data"))
+    args = parser.parse_args(argv)
+
+    store = SqliteStore(args.db)
+    if args.command == "import":
+        store.import_csv(csv_paths(args.data_dir))
+    else:
+        store.export_csv(args.data_dir)
+    store.close()
+    print(f"{args.command}ed {args.data_dir} <-> {args.db}")
+
+
+if __name__ == "__main__":
+    main()
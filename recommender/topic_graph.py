@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+
+
+def normalize_relation(relation):
+    if relation is None or (isinstance(relation, float) and pd.isna(relation)):
+        return ""
+    return str(relation).strip().lower()
+
+
+def iter_bits(bits):
+    """Positions of the set bits of an int, lowest first."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class PrerequisiteClosure:
+    """
+    Transitive closure of the prerequisite edges over interned topic ids,
+    held as int bitsets: requires[i] has bit j set when topic i needs j
+    somewhere down its chain, required_by[j] is the reverse. Adding an edge
+    only ORs the two affected cones together, so edits never trigger a
+    full recompute. Topics with more prerequisites sort later, which puts
+    any chain in learning order (a topic's closure strictly contains each
+    of its prerequisites' closures).
+    """
+
+    def __init__(self, topic_ids):
+        self.topic_ids = topic_ids
+        self._requires = []
+        self._required_by = []
+        self._chains = {}
+
+    def _grow(self, n):
+        while len(self._requires) < n:
+            self._requires.append(0)
+            self._required_by.append(0)
+
+    def add(self, topic_id, prereq_id):
+        self._grow(max(topic_id, prereq_id) + 1)
+        if self._requires[topic_id] >> prereq_id & 1:
+            return
+        up = self._required_by[topic_id] | (1 << topic_id)
+        down = self._requires[prereq_id] | (1 << prereq_id)
+        for i in iter_bits(up):
+            self._requires[i] |= down
+        for i in iter_bits(down):
+            self._required_by[i] |= up
+        self._chains = {}
+
+    def copy(self):
+        """An independent closure with the same edges (the bitsets are immutable ints)."""
+        closure = PrerequisiteClosure(self.topic_ids)
+        closure._requires = list(self._requires)
+        closure._required_by = list(self._required_by)
+        return closure
+
+    def requires(self, topic_id):
+        return self._requires[topic_id] if topic_id < len(self._requires) else 0
+
+    def required_by(self, topic_id):
+        return self._required_by[topic_id] if topic_id < len(self._required_by) else 0
+
+    def chain(self, topic_id):
+        """int32 ids of every transitive prerequisite of topic_id, roots first (cached until the next add)."""
+        chain = self._chains.get(topic_id)
+        if chain is None:
+            ids = [i for i in iter_bits(self.requires(topic_id)) if i != topic_id]
+            ids.sort(key=lambda i: (self._requires[i].bit_count(), i))
+            chain = self._chains[topic_id] = np.array(ids, dtype=np.int32)
+        return chain
+
+
+class TopicGraph:
+    """
+    Adjacency index compiled once from the topic_graph table:
+    topic -> {relation -> [related topics]}, relation names lower-cased.
+
+    add_edge() edits the graph in place and is only for building one; a
+    graph that readers may be using is changed with with_edge(), which
+    leaves it untouched (see Recommender.add_edge).
+    """
+
+    def __init__(self, df=None):
+        self._adj = {}
+        self._compiled = None
+        self._closure = None
+        if df is not None:
+            self.rebuild(df)
+
+    def rebuild(self, df):
+        self._adj = {}
+        self._compiled = None
+        self._closure = None
+        if df is None or df.empty:
+            return
+        relations = df['relation'] if 'relation' in df.columns else [""] * len(df)
+        related = df['related_topic'] if 'related_topic' in df.columns else [""] * len(df)
+        for topic, relation, rel_topic in zip(df['topic'], relations, related):
+            self.add_edge(topic, relation, rel_topic)
+
+    def with_edge(self, topic, relation, related_topic):
+        """A new graph with one more edge; only the touched topic's relations and the closure are copied."""
+        graph = TopicGraph()
+        graph._adj = dict(self._adj)
+        graph._adj[topic] = {rel: list(targets) for rel, targets in self._adj.get(topic, {}).items()}
+        if self._closure is not None:
+            graph._closure = self._closure.copy()
+        graph.add_edge(topic, relation, related_topic)
+        return graph
+
+    def add_edge(self, topic, relation, related_topic):
+        self._compiled = None
+        relation = normalize_relation(relation)
+        targets = self._adj.setdefault(topic, {}).setdefault(relation, [])
+        if related_topic not in targets:
+            targets.append(related_topic)
+            if relation == 'prerequisite' and self._closure is not None:
+                ids = self._closure.topic_ids
+                self._closure.add(ids.intern(topic), ids.intern(related_topic))
+
+    # ---------------- Queries ----------------
+    def relations(self, topic):
+        return self._adj.get(topic, {})
+
+    def related(self, topic, relation):
+        return self._adj.get(topic, {}).get(normalize_relation(relation), [])
+
+    def first_related(self, topic, relation):
+        targets = self.related(topic, relation)
+        return targets[0] if targets else None
+
+    def compiled(self, topic_ids):
+        """
+        The graph as interned id arrays, rebuilt after edits:
+        (topics, has_other, prereq_src, prereq_dst) where has_other[i] says
+        topics[i] has a non-prerequisite relation and prereq_src -> prereq_dst
+        are the prerequisite edges.
+        """
+        if self._compiled is None or self._compiled[0] is not topic_ids:
+            topics = list(self._adj)
+            has_other = [any(rel != 'prerequisite' for rel in self._adj[t]) for t in topics]
+            src = [t for t in topics for _ in self._adj[t].get('prerequisite', [])]
+            dst = [p for t in topics for p in self._adj[t].get('prerequisite', [])]
+            self._compiled = (topic_ids, (
+                topic_ids.encode(topics),
+                np.array(has_other, dtype=bool),
+                topic_ids.encode(src),
+                topic_ids.encode(dst),
+            ))
+        return self._compiled[1]
+
+    def closure(self, topic_ids):
+        """The PrerequisiteClosure over topic_ids, built on first use and kept current by add_edge."""
+        if self._closure is None or self._closure.topic_ids is not topic_ids:
+            closure = PrerequisiteClosure(topic_ids)
+            for topic, relations in self._adj.items():
+                for prereq in relations.get('prerequisite', []):
+                    closure.add(topic_ids.intern(topic), topic_ids.intern(prereq))
+            self._closure = closure
+        return self._closure
+
+    def to_frame(self):
+        rows = [
+            (topic, relation, related)
+            for topic, relations in self._adj.items()
+            for relation, targets in relations.items()
+            for related in targets
+        ]
+        return pd.DataFrame(rows, columns=['topic', 'relation', 'related_topic'])
+
+    def items(self):
+        return self._adj.items()
+
+    def __contains__(self, topic):
+        return topic in self._adj
+
+    def __len__(self):
+        return len(self._adj)
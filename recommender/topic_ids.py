@@ -0,0 +1,51 @@
+import threading
+import numpy as np
+import pandas as pd
+
+
+class TopicIds:
+    """
+    Interns topic names to dense int32 ids (0..n-1) in first-seen order,
+    so per-student data can be held as small integer arrays and boolean
+    masks instead of repeated strings. Ids are never reassigned, and a
+    name is published before its id, so lookups need no lock.
+    """
+
+    def __init__(self, topics=()):
+        self._ids = {}
+        self._names = []
+        self._lock = threading.Lock()
+        self.encode(topics)
+
+    def intern(self, topic):
+        i = self._ids.get(topic)
+        if i is None:
+            with self._lock:
+                i = self._ids.get(topic)
+                if i is None:
+                    self._names.append(topic)
+                    i = self._ids[topic] = len(self._names) - 1
+        return i
+
+    def get(self, topic, default=None):
+        return self._ids.get(topic, default)
+
+    def encode(self, topics):
+        """int32 ids for a sequence of topics, interning unseen ones."""
+        if not isinstance(topics, (pd.Series, np.ndarray)):
+            topics = list(topics)
+        codes, uniques = pd.factorize(pd.Series(topics, dtype=object), use_na_sentinel=False)
+        lookup = np.array([self.intern(t) for t in uniques], dtype=np.int32)
+        return lookup[codes] if len(codes) else np.empty(0, dtype=np.int32)
+
+    def name(self, i):
+        return self._names[i]
+
+    def names(self, ids):
+        return [self._names[i] for i in ids]
+
+    def __contains__(self, topic):
+        return topic in self._ids
+
+    def __len__(self):
+        return len(self._names)